@@ -0,0 +1,174 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from recipes.caches import bump_version, get_version
+from users.models import User
+
+TOKEN_KEY = 'auth:token:{}'
+INVALIDATED_KEY = 'auth:token:invalidated:{}'
+TOKENS_VERSION = 'tokens'
+# Поля пользователя в снимке. Остальные, включая пароль, отложены
+# и при обращении читаются из базы.
+USER_FIELDS = (
+    'id', 'username', 'email', 'first_name', 'last_name',
+    'is_active', 'is_staff', 'is_superuser'
+)
+# Больше пропущенных версий процесс не догоняет и сбрасывает
+# свои записи целиком.
+MAX_VERSIONS_BEHIND = 100
+
+
+def token_cache_key(key):
+    """Ключ общего кэша без самого токена в открытом виде."""
+    return TOKEN_KEY.format(hashlib.sha256(key.encode()).hexdigest())
+
+
+def snapshot(token):
+    """Значения полей пользователя токена для кэша."""
+    return tuple(getattr(token.user, field) for field in USER_FIELDS)
+
+
+def restore(key, values):
+    """Токен с пользователем из снимка без запроса к базе.
+
+    from_db ждёт значения в порядке полей модели.
+    """
+    fields = dict(zip(USER_FIELDS, values))
+    names = [
+        field.attname for field in User._meta.concrete_fields
+        if field.attname in fields
+    ]
+    user = User.from_db(
+        DEFAULT_DB_ALIAS, names, [fields[name] for name in names]
+    )
+    token = Token(key=key, user_id=user.id)
+    token.user = user
+    return token
+
+
+class TokenCache:
+    """Снимки токенов с пользователями в двух уровнях кэша.
+
+    Первый уровень - ограниченный LRU в памяти процесса, второй -
+    общий кэш Django. Оба уровня хранят запись не дольше
+    AUTH_TOKEN_CACHE_TIMEOUT. Выход и изменение пользователя
+    удаляют его токены из общего кэша и увеличивают общую версию
+    токенов вместе с записью, какие токены сброшены. Процесс
+    сверяет версию не чаще раза в AUTH_TOKEN_VERSION_INTERVAL
+    секунд и удаляет у себя только сброшенные токены.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked_at = None
+        self._tokens = OrderedDict()
+
+    def get(self, key):
+        version = self.sync()
+        token = self.lookup(key)
+        if token is not None:
+            return token
+        values = cache.get(token_cache_key(key))
+        if values is None:
+            return None
+        self.remember(key, values, version)
+        return restore(key, values)
+
+    def sync(self):
+        """Применяет сбросы токенов из других процессов."""
+        now = time.monotonic()
+        if (
+            self._checked_at is not None
+            and now - self._checked_at < settings.AUTH_TOKEN_VERSION_INTERVAL
+        ):
+            return self._version
+        version = get_version(TOKENS_VERSION)
+        with self._lock:
+            self._checked_at = now
+            if self._version != version:
+                self.forget(self.invalidated_since(self._version, version))
+                self._version = version
+            return self._version
+
+    def invalidated_since(self, old, new):
+        """Токены, сброшенные между версиями, или None, если их не узнать."""
+        if old is None or not 0 < new - old <= MAX_VERSIONS_BEHIND:
+            return None
+        names = [
+            INVALIDATED_KEY.format(version)
+            for version in range(old + 1, new + 1)
+        ]
+        found = cache.get_many(names)
+        if len(found) != len(names):
+            return None
+        return [key for keys in found.values() for key in keys]
+
+    def forget(self, keys):
+        """Удаляет токены из памяти процесса, все при keys=None."""
+        if keys is None:
+            self._tokens.clear()
+            return
+        for key in keys:
+            self._tokens.pop(key, None)
+
+    def lookup(self, key):
+        """Токен из памяти процесса или None."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._tokens.pop(key, None)
+            if entry is None or entry[1] <= now:
+                return None
+            self._tokens[key] = entry
+        return restore(key, entry[0])
+
+    def set(self, key, token):
+        values = snapshot(token)
+        cache.set(
+            token_cache_key(key), values,
+            timeout=settings.AUTH_TOKEN_CACHE_TIMEOUT
+        )
+        self.remember(key, values, self.sync())
+
+    def remember(self, key, values, version):
+        expires_at = time.monotonic() + settings.AUTH_TOKEN_CACHE_TIMEOUT
+        with self._lock:
+            if self._version != version:
+                return
+            self._tokens[key] = (values, expires_at)
+            self._tokens.move_to_end(key)
+            while len(self._tokens) > settings.AUTH_TOKEN_CACHE_SIZE:
+                self._tokens.popitem(last=False)
+
+    def invalidate(self, keys):
+        """Удаляет токены из обоих уровней кэша."""
+        cache.delete_many([token_cache_key(key) for key in keys])
+        version = bump_version(TOKENS_VERSION)
+        cache.set(
+            INVALIDATED_KEY.format(version), list(keys),
+            timeout=settings.AUTH_TOKEN_CACHE_TIMEOUT
+        )
+        with self._lock:
+            self.forget(keys)
+
+
+token_cache = TokenCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication без запроса к базе для известных токенов."""
+
+    def authenticate_credentials(self, key):
+        token = token_cache.get(key)
+        if token is None:
+            _, token = super().authenticate_credentials(key)
+            token_cache.set(key, token)
+        return token.user, token
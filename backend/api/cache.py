@@ -0,0 +1,192 @@
+import hashlib
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+
+GENERATION_KEY = 'recipes:response:generation'
+LIST_GENERATION_KEY = 'recipes:response:list-generation'
+CHANGES_KEY = 'recipes:response:changes'
+RECIPE_VERSION_KEY = 'recipes:response:recipe:{}'
+LIST_KEY = 'recipes:response:list:{}:{}:{}'
+DETAIL_KEY = 'recipes:response:detail:{}:{}:{}:{}'
+FRAGMENT_KEY = 'recipes:fragment:{}:{}:{}:{}'
+
+
+def get_token(key):
+    """Текущий токен версии, новый токен при отсутствии ключа."""
+    token = cache.get(key)
+    if token is None:
+        token = uuid4().hex
+        if not cache.add(key, token, timeout=None):
+            return cache.get(key)
+    return token
+
+
+def bump_token(*keys):
+    """Меняет токены версий, делая зависимые ответы устаревшими."""
+    cache.set_many({key: uuid4().hex for key in keys}, timeout=None)
+
+
+def invalidate_all():
+    """Устаревают все сохранённые ответы (теги, ингредиенты)."""
+    bump_token(GENERATION_KEY, CHANGES_KEY)
+
+
+def invalidate_lists():
+    """Устаревают списки рецептов (рецепт добавлен или удалён)."""
+    bump_token(LIST_GENERATION_KEY, CHANGES_KEY)
+
+
+def invalidate_recipes(recipe_ids):
+    """Устаревают ответы, содержащие указанные рецепты."""
+    bump_token(
+        CHANGES_KEY, *(RECIPE_VERSION_KEY.format(pk) for pk in recipe_ids)
+    )
+
+
+def get_changes_token():
+    """Токен любых изменений, читается до запросов к базе."""
+    return get_token(CHANGES_KEY)
+
+
+def set_unchanged(entries, changes):
+    """Сохраняет ответы, если с чтения токена changes ничего не менялось.
+
+    Иначе ответ мог быть собран из старых данных и попал бы в кэш
+    под новыми токенами. Повторная проверка убирает ответы, если
+    изменение зафиксировано между проверкой и записью.
+    """
+    if get_changes_token() != changes:
+        return
+    cache.set_many(entries, timeout=settings.RECIPE_RESPONSE_CACHE_TIMEOUT)
+    if get_changes_token() != changes:
+        cache.delete_many(list(entries))
+
+
+def get_list_stamp():
+    """Отметка версии любых списков рецептов."""
+    return get_token(GENERATION_KEY), get_token(CHANGES_KEY)
+
+
+def get_recipe_version(recipe_id):
+    """Токен версии рецепта без создания нового.
+
+    Токен создаётся только при сохранении ответа по рецепту, поэтому
+    запросы к несуществующим id не оставляют ключей в кэше.
+    """
+    return cache.get(RECIPE_VERSION_KEY.format(recipe_id))
+
+
+def get_recipe_stamp(recipe_id):
+    """Отметка версии одного рецепта, None до первого ответа по нему."""
+    version = get_recipe_version(recipe_id)
+    if version is None:
+        return None
+    return get_token(GENERATION_KEY), version
+
+
+def normalize_params(request):
+    """Ключ запроса, не зависящий от порядка параметров."""
+    params = sorted(
+        (name, sorted(value for value in values if value))
+        for name, values in request.GET.lists()
+    )
+    raw = repr((request.get_host(), request.path, params))
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def get_recipe_versions(recipe_ids):
+    keys = {pk: RECIPE_VERSION_KEY.format(pk) for pk in recipe_ids}
+    tokens = cache.get_many(keys.values())
+    return {pk: tokens.get(key) for pk, key in keys.items()}
+
+
+def fragment_keys(request, recipe_ids):
+    """Ключи общих частей рецептов для текущих версий рецептов."""
+    generation = get_token(GENERATION_KEY)
+    host = request.get_host()
+    return {
+        pk: FRAGMENT_KEY.format(generation, host, pk, version)
+        for pk, version in get_recipe_versions(recipe_ids).items()
+        if version is not None
+    }
+
+
+def get_fragments(request, recipe_ids):
+    """Сохранённые общие части рецептов, без флагов пользователя."""
+    keys = fragment_keys(request, recipe_ids)
+    fragments = cache.get_many(keys.values())
+    return {
+        pk: fragments[key] for pk, key in keys.items() if key in fragments
+    }
+
+
+def set_fragments(request, fragments, changes):
+    generation = get_token(GENERATION_KEY)
+    host = request.get_host()
+    set_unchanged(
+        {
+            FRAGMENT_KEY.format(
+                generation, host, pk,
+                get_token(RECIPE_VERSION_KEY.format(pk))
+            ): fragment
+            for pk, fragment in fragments.items()
+        },
+        changes
+    )
+
+
+def get_list(request):
+    """Сохранённая страница списка рецептов, если она актуальна.
+
+    Возвращает словарь с ответом data и отметкой stamp, по которой
+    он был собран: ETag строится по ней, а не по текущим токенам.
+    """
+    key = LIST_KEY.format(
+        get_token(GENERATION_KEY), get_token(LIST_GENERATION_KEY),
+        normalize_params(request)
+    )
+    entry = cache.get(key)
+    if entry is None:
+        return None
+    versions = get_recipe_versions(entry['versions'])
+    if versions != entry['versions']:
+        return None
+    return entry
+
+
+def set_list(request, data, stamp):
+    """Сохраняет страницу с отметкой, прочитанной до выборки."""
+    results = data['results'] if isinstance(data, dict) else data
+    versions = {
+        recipe['id']: get_token(RECIPE_VERSION_KEY.format(recipe['id']))
+        for recipe in results
+    }
+    key = LIST_KEY.format(
+        get_token(GENERATION_KEY), get_token(LIST_GENERATION_KEY),
+        normalize_params(request)
+    )
+    set_unchanged(
+        {key: {'data': data, 'versions': versions, 'stamp': stamp}},
+        stamp[1]
+    )
+
+
+def detail_key(request, recipe_id, version):
+    return DETAIL_KEY.format(
+        get_token(GENERATION_KEY), request.get_host(), recipe_id, version
+    )
+
+
+def get_detail(request, recipe_id):
+    """Сохранённый ответ по рецепту, если он актуален."""
+    version = get_recipe_version(recipe_id)
+    if version is None:
+        return None
+    return cache.get(detail_key(request, recipe_id, version))
+
+
+def set_detail(request, recipe_id, data, changes):
+    version = get_token(RECIPE_VERSION_KEY.format(recipe_id))
+    set_unchanged({detail_key(request, recipe_id, version): data}, changes)
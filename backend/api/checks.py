@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+PROCESS_LOCAL_CACHES = ('django.core.cache.backends.locmem.LocMemCache',)
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """Предупреждает, если кэш по умолчанию не общий для процессов.
+
+    В нём хранятся версии тегов, ингредиентов и ответов, которые
+    меняют команды управления и другие воркеры. Для одного процесса
+    при локальной разработке кэш в памяти подходит.
+    """
+    backend = settings.CACHES['default']['BACKEND']
+    if backend not in PROCESS_LOCAL_CACHES:
+        return []
+    return [Warning(
+        f'Кэш {backend} виден только одному процессу: изменения из '
+        'команд управления и других воркеров не сбросят версии данных.',
+        hint='Укажите общий кэш в CACHE_BACKEND и CACHE_LOCATION, '
+             'например django.core.cache.backends.redis.RedisCache.',
+        id='api.W001',
+    )]
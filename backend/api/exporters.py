@@ -0,0 +1,333 @@
+import csv
+import struct
+import zlib
+from functools import lru_cache
+from pathlib import Path
+
+SHOPPING_LIST_TITLE = 'Список покупок'
+
+PDF_ENCODING = 'cp1251'
+# Подмножество DejaVu Sans с символами cp1251, лицензия в fonts/LICENSE.
+PDF_FONT_PATH = Path(__file__).resolve().parent / 'fonts' / 'DejaVuSans.ttf'
+PDF_FONT_NAME = 'DejaVuSans'
+PDF_FIRST_CHAR = 32
+PDF_LAST_CHAR = 255
+PDF_FONT_SIZE = 12
+PDF_LINE_HEIGHT = 16
+PDF_LINES_PER_PAGE = 46
+PDF_PAGE_WIDTH = 595
+PDF_PAGE_HEIGHT = 842
+PDF_MARGIN = 50
+
+
+class Echo:
+    """Псевдофайл для csv.writer, возвращающий записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def shopping_list_lines(ingredients):
+    """Строки списка покупок для вывода."""
+    for ingredient in ingredients:
+        yield (
+            f"{ingredient['ingredient__name']} - "
+            f"{ingredient['total_amount']} "
+            f"{ingredient['ingredient__measurement_unit']}"
+        )
+
+
+def export_txt(ingredients):
+    """Список покупок в текстовом формате."""
+    yield f'{SHOPPING_LIST_TITLE}\n\n'
+    for line in shopping_list_lines(ingredients):
+        yield f'{line}\n'
+
+
+def export_csv(ingredients):
+    """Список покупок в формате CSV."""
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'measurement_unit', 'amount'))
+    for ingredient in ingredients:
+        yield writer.writerow((
+            ingredient['ingredient__name'],
+            ingredient['ingredient__measurement_unit'],
+            ingredient['total_amount'],
+        ))
+
+
+def pdf_code_char(code):
+    """Символ cp1251 для кода или None, если код не занят."""
+    try:
+        return bytes((code,)).decode(PDF_ENCODING)
+    except UnicodeDecodeError:
+        return None
+
+
+def pdf_glyph_name(char):
+    """Имя глифа по Adobe Glyph List.
+
+    Для кириллицы берутся имена afii, для остальных символов -
+    имена вида uniXXXX.
+    """
+    if char == 'Ё':
+        return 'afii10023'
+    if char == 'ё':
+        return 'afii10071'
+    if 'А' <= char <= 'я':
+        offset = ord(char) - ord('А')
+        first, offset = (10017, offset) if offset < 32 else (
+            10065, offset - 32
+        )
+        return f'afii{first + offset + (offset >= 6)}'
+    return f'uni{ord(char):04X}'
+
+
+def pdf_differences():
+    """Отличия кодировки cp1251 от WinAnsiEncoding для словаря шрифта."""
+    names = []
+    for code in range(128, 256):
+        char = pdf_code_char(code)
+        if char is not None:
+            names.append(f'{code} /{pdf_glyph_name(char)}')
+    return f'[{" ".join(names)}]'
+
+
+class TrueTypeFont:
+    """Метрики и сжатые данные шрифта TrueType для встраивания в PDF.
+
+    Читаются только таблицы, нужные словарю шрифта: head, hhea,
+    hmtx, OS/2 и cmap (3, 1) формата 4.
+    """
+
+    def __init__(self, path):
+        data = path.read_bytes()
+        self.tables = self.read_tables(data)
+        head, hhea = self.tables['head'], self.tables['hhea']
+        self.scale = 1000 / struct.unpack_from('>H', head, 18)[0]
+        self.bbox = [
+            round(value * self.scale)
+            for value in struct.unpack_from('>4h', head, 36)
+        ]
+        self.ascent, self.descent = (
+            round(value * self.scale)
+            for value in struct.unpack_from('>2h', hhea, 4)
+        )
+        os2 = self.tables['OS/2']
+        self.cap_height = self.ascent
+        if struct.unpack_from('>H', os2)[0] >= 2:
+            self.cap_height = round(
+                struct.unpack_from('>h', os2, 88)[0] * self.scale
+            )
+        self.length = len(data)
+        self.compressed = zlib.compress(data)
+
+    @staticmethod
+    def read_tables(data):
+        count = struct.unpack_from('>H', data, 4)[0]
+        tables = {}
+        for index in range(count):
+            tag, _, offset, length = struct.unpack_from(
+                '>4sIII', data, 12 + 16 * index
+            )
+            tables[tag.decode('latin-1')] = data[offset:offset + length]
+        return tables
+
+    def glyph_id(self, char):
+        """Номер глифа символа по таблице cmap (3, 1) формата 4."""
+        cmap = self.tables['cmap']
+        code = ord(char)
+        for index in range(struct.unpack_from('>H', cmap, 2)[0]):
+            platform, encoding, offset = struct.unpack_from(
+                '>HHI', cmap, 4 + 8 * index
+            )
+            if (platform, encoding) != (3, 1):
+                continue
+            segments = struct.unpack_from('>H', cmap, offset + 6)[0] // 2
+            ends = offset + 14
+            starts = ends + 2 * segments + 2
+            deltas = starts + 2 * segments
+            range_offsets = deltas + 2 * segments
+            for segment in range(segments):
+                end, start, delta, range_offset = (
+                    struct.unpack_from('>H', cmap, array + 2 * segment)[0]
+                    for array in (ends, starts, deltas, range_offsets)
+                )
+                if not start <= code <= end:
+                    continue
+                if range_offset == 0:
+                    return (code + delta) & 0xFFFF
+                glyph = struct.unpack_from(
+                    '>H', cmap,
+                    range_offsets + 2 * segment + range_offset
+                    + 2 * (code - start)
+                )[0]
+                return (glyph + delta) & 0xFFFF if glyph else 0
+        return 0
+
+    def width(self, char):
+        """Ширина символа в тысячных долях кегля."""
+        metrics = struct.unpack_from('>H', self.tables['hhea'], 34)[0]
+        glyph = min(self.glyph_id(char), metrics - 1)
+        advance = struct.unpack_from('>H', self.tables['hmtx'], 4 * glyph)[0]
+        return round(advance * self.scale)
+
+    def widths(self):
+        """Ширины символов для кодов от PDF_FIRST_CHAR до PDF_LAST_CHAR."""
+        return [
+            0 if char is None else self.width(char)
+            for char in map(
+                pdf_code_char, range(PDF_FIRST_CHAR, PDF_LAST_CHAR + 1)
+            )
+        ]
+
+
+@lru_cache(maxsize=None)
+def pdf_font():
+    """Шрифт читается один раз на процесс."""
+    return TrueTypeFont(PDF_FONT_PATH)
+
+
+def pdf_escape(text):
+    """Кодирует строку для текстового оператора PDF."""
+    encoded = text.encode(PDF_ENCODING, errors='replace')
+    return (
+        encoded.replace(b'\\', b'\\\\')
+        .replace(b'(', b'\\(')
+        .replace(b')', b'\\)')
+    )
+
+
+class PDFStreamWriter:
+    """Потоковая запись PDF.
+
+    Объекты отдаются по мере формирования, в памяти хранятся только
+    смещения объектов и номера страниц.
+    """
+    catalog_id = 1
+    pages_id = 2
+    font_id = 3
+    font_descriptor_id = 4
+    font_file_id = 5
+
+    def __init__(self):
+        self.offsets = {}
+        self.page_ids = []
+        self.position = 0
+        self.next_id = 6
+
+    def chunk(self, data):
+        self.position += len(data)
+        return data
+
+    def write_object(self, object_id, body):
+        self.offsets[object_id] = self.position
+        return self.chunk(
+            b'%d 0 obj\n' % object_id + body + b'\nendobj\n'
+        )
+
+    def header(self):
+        return self.chunk(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def font(self):
+        """Шрифт с кириллицей, встроенный в документ.
+
+        Стандартные шрифты PDF кириллицы не содержат, и без
+        встраивания просмотрщик подставляет произвольный шрифт.
+        """
+        font = pdf_font()
+        widths = ' '.join(map(str, font.widths()))
+        bbox = ' '.join(map(str, font.bbox))
+        return b''.join((
+            self.write_object(self.font_id, (
+                '<< /Type /Font /Subtype /TrueType '
+                f'/BaseFont /{PDF_FONT_NAME} '
+                f'/FirstChar {PDF_FIRST_CHAR} /LastChar {PDF_LAST_CHAR} '
+                f'/Widths [{widths}] '
+                f'/FontDescriptor {self.font_descriptor_id} 0 R '
+                '/Encoding << /Type /Encoding /BaseEncoding /WinAnsiEncoding '
+                f'/Differences {pdf_differences()} >> >>'
+            ).encode()),
+            self.write_object(self.font_descriptor_id, (
+                f'<< /Type /FontDescriptor /FontName /{PDF_FONT_NAME} '
+                f'/Flags 32 /FontBBox [{bbox}] /ItalicAngle 0 '
+                f'/Ascent {font.ascent} /Descent {font.descent} '
+                f'/CapHeight {font.cap_height} /StemV 80 '
+                f'/FontFile2 {self.font_file_id} 0 R >>'
+            ).encode()),
+            self.write_object(
+                self.font_file_id,
+                b'<< /Length %d /Length1 %d /Filter /FlateDecode >>\n'
+                b'stream\n' % (len(font.compressed), font.length)
+                + font.compressed + b'\nendstream'
+            ),
+        ))
+
+    def page(self, lines):
+        content_id, page_id = self.next_id, self.next_id + 1
+        self.next_id += 2
+        self.page_ids.append(page_id)
+        top = PDF_PAGE_HEIGHT - PDF_MARGIN
+        stream = b''.join((
+            b'BT\n/F1 %d Tf\n%d TL\n%d %d Td\n' % (
+                PDF_FONT_SIZE, PDF_LINE_HEIGHT, PDF_MARGIN, top
+            ),
+            *(b'(' + pdf_escape(line) + b') Tj T*\n' for line in lines),
+            b'ET',
+        ))
+        content = self.write_object(
+            content_id,
+            b'<< /Length %d >>\nstream\n' % len(stream)
+            + stream + b'\nendstream'
+        )
+        page = self.write_object(page_id, (
+            f'<< /Type /Page /Parent {self.pages_id} 0 R '
+            f'/MediaBox [0 0 {PDF_PAGE_WIDTH} {PDF_PAGE_HEIGHT}] '
+            f'/Resources << /Font << /F1 {self.font_id} 0 R >> >> '
+            f'/Contents {content_id} 0 R >>'
+        ).encode())
+        return content + page
+
+    def trailer(self):
+        kids = ' '.join(f'{page_id} 0 R' for page_id in self.page_ids)
+        pages = self.write_object(self.pages_id, (
+            f'<< /Type /Pages /Kids [{kids}] '
+            f'/Count {len(self.page_ids)} >>'
+        ).encode())
+        catalog = self.write_object(
+            self.catalog_id,
+            f'<< /Type /Catalog /Pages {self.pages_id} 0 R >>'.encode()
+        )
+        xref_position = self.position
+        size = self.next_id
+        xref = [b'xref\n0 %d\n' % size, b'0000000000 65535 f \n']
+        for object_id in range(1, size):
+            xref.append(b'%010d 00000 n \n' % self.offsets[object_id])
+        xref.append(
+            b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n'
+            % (size, self.catalog_id, xref_position)
+        )
+        return pages + catalog + b''.join(xref)
+
+
+def export_pdf(ingredients):
+    """Список покупок в формате PDF."""
+    writer = PDFStreamWriter()
+    yield writer.header()
+    yield writer.font()
+    lines = [SHOPPING_LIST_TITLE, '']
+    for line in shopping_list_lines(ingredients):
+        lines.append(line)
+        if len(lines) == PDF_LINES_PER_PAGE:
+            yield writer.page(lines)
+            lines = []
+    if lines or not writer.page_ids:
+        yield writer.page(lines)
+    yield writer.trailer()
+
+
+EXPORTERS = {
+    'txt': export_txt,
+    'csv': export_csv,
+    'pdf': export_pdf,
+}
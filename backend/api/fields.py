@@ -0,0 +1,27 @@
+import filetype
+from django.conf import settings
+from drf_extra_fields.fields import Base64FieldMixin, Base64ImageField
+from rest_framework import serializers
+
+
+class RawBase64ImageField(Base64FieldMixin, serializers.FileField):
+    """Изображение в base64 без декодирования пикселей в запросе.
+
+    Тип определяется по сигнатуре файла, полная проверка и обработка
+    выполняются в фоне (recipes.images).
+    """
+    ALLOWED_TYPES = Base64ImageField.ALLOWED_TYPES
+    INVALID_FILE_MESSAGE = Base64ImageField.INVALID_FILE_MESSAGE
+    INVALID_TYPE_MESSAGE = Base64ImageField.INVALID_TYPE_MESSAGE
+
+    def get_file_extension(self, filename, decoded_file):
+        return filetype.guess_extension(decoded_file)
+
+    def to_internal_value(self, base64_data):
+        file = super().to_internal_value(base64_data)
+        if file is not None and file.size > settings.RECIPE_IMAGE_MAX_SIZE:
+            raise serializers.ValidationError(
+                'Размер изображения больше '
+                f'{settings.RECIPE_IMAGE_MAX_SIZE // 2 ** 20} МБ.'
+            )
+        return file
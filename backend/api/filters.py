@@ -1,36 +1,64 @@
+from django.db.models import Exists, OuterRef
 from django_filters import rest_framework as filters
-from rest_framework.filters import SearchFilter
 
-from recipes.models import Recipe, Tag
+from recipes.caches import tag_cache, tag_slug_choices
+from recipes.models import Cart, Favorite, Recipe
+from recipes.ranking import ORDERINGS
+from recipes.search import search_recipes
 
 
 class RecipeFilter(filters.FilterSet):
-    """Фильтрация по избранному, автору, списку покупок и тегам."""
-    tags = filters.ModelMultipleChoiceFilter(
-        field_name='tags__slug',
-        to_field_name='slug',
-        queryset=Tag.objects.all(),
+    """Фильтрация по избранному, автору, списку покупок, тегам и поиску.
+
+    Фильтры по связанным таблицам выполняются через EXISTS,
+    поэтому строки рецептов не дублируются и DISTINCT не нужен.
+    Сортировки по популярности используют предрасчитанные оценки.
+    """
+    tags = filters.MultipleChoiceFilter(
+        method='filter_tags',
+        choices=tag_slug_choices,
     )
     author = filters.CharFilter()
     is_favorited = filters.NumberFilter(method='filter_is_favorited')
     is_in_shopping_cart = filters.NumberFilter(
         method='filter_is_in_shopping_cart'
     )
+    search = filters.CharFilter(method='filter_search')
+    ordering = filters.ChoiceFilter(
+        method='filter_ordering',
+        choices=[(name, name) for name in ORDERINGS],
+    )
 
     class Meta:
         model = Recipe
         fields = ['tags', 'author', 'is_favorited']
 
+    def filter_tags(self, queryset, name, value):
+        if not value:
+            return queryset
+        return queryset.filter(Exists(
+            Recipe.tags.through.objects.filter(
+                recipe_id=OuterRef('pk'),
+                tag_id__in=tag_cache.ids_for_slugs(value),
+            )
+        ))
+
     def filter_is_favorited(self, queryset, name, value):
         if value == 1 and self.request.user.is_authenticated:
-            return queryset.filter(in_favorites__user=self.request.user)
+            return queryset.filter(Exists(Favorite.objects.filter(
+                user=self.request.user, recipe_id=OuterRef('pk')
+            )))
         return queryset
 
     def filter_is_in_shopping_cart(self, queryset, name, value):
         if value == 1 and self.request.user.is_authenticated:
-            return queryset.filter(cart_recipe__user=self.request.user)
+            return queryset.filter(Exists(Cart.objects.filter(
+                user=self.request.user, recipe_id=OuterRef('pk')
+            )))
         return queryset
 
+    def filter_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
 
-class CustomSearchFilter(SearchFilter):
-    search_param = 'name'
+    def filter_ordering(self, queryset, name, value):
+        return queryset.order_by(*ORDERINGS[value])
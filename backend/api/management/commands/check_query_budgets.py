@@ -0,0 +1,271 @@
+import sys
+from collections import Counter
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api import cache as response_cache
+from recipes.feed import backfill
+from recipes.models import (Cart, Favorite, Ingredient, Recipe,
+                            RecipeIngredient, ShoppingListItem, Tag)
+from users.models import Follow, User
+
+USERS_COUNT = 60
+RECIPES_COUNT = 300
+INGREDIENTS_COUNT = 200
+TAGS_COUNT = 6
+INGREDIENTS_PER_RECIPE = 8
+FOLLOWS_PER_USER = 20
+FAVORITES_PER_USER = 40
+CART_PER_USER = 15
+PAGE_SIZES = (6, 50)
+TEST_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'query-checks',
+    }
+}
+
+# (адрес, авторизованный запрос, бюджет запросов, есть ли пагинация)
+BUDGETS = (
+    ('/api/tags/', False, 1, False),
+    ('/api/tags/{tag}/', False, 1, False),
+    ('/api/ingredients/?name=ингр', False, 1, False),
+    ('/api/ingredients/{ingredient}/', False, 1, False),
+    ('/api/recipes/', False, 4, True),
+    ('/api/recipes/?tags={tag_slug}&author={author}', False, 4, True),
+    ('/api/recipes/', True, 7, True),
+    ('/api/recipes/?pagination=cursor', True, 6, True),
+    ('/api/recipes/?is_favorited=1&is_in_shopping_cart=1', True, 7, True),
+    ('/api/recipes/{recipe}/', False, 3, False),
+    ('/api/recipes/{recipe}/', True, 5, False),
+    ('/api/recipes/download_shopping_cart/', True, 1, False),
+    ('/api/recipes/changes/?since={since}', False, 8, False),
+    ('/api/recipes/changes/?since={since}', True, 11, False),
+    ('/api/recipes/feed/', True, 8, True),
+    ('/api/recipes/feed/?pagination=cursor', True, 7, True),
+    ('/api/users/', False, 1, False),
+    ('/api/users/', True, 1, False),
+    ('/api/users/{author}/', True, 1, False),
+    ('/api/users/me/', True, 1, False),
+    ('/api/users/subscriptions/', True, 3, True),
+    ('/api/users/subscriptions/?recipes_limit=3', True, 3, True),
+    ('/api/users/subscriptions/?pagination=cursor', True, 2, True),
+)
+
+
+class RollbackError(Exception):
+    """Откатывает транзакцию с тестовыми данными."""
+
+
+@contextmanager
+def test_environment():
+    """Отдельная тестовая база и кэш в памяти процесса.
+
+    Проверка сбрасывает кэш ответов и заполняет базу, поэтому рабочие
+    база и общий кэш в ней не участвуют.
+    """
+    with override_settings(CACHES=TEST_CACHES):
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False
+        )
+        try:
+            yield
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def field_path():
+    """Возвращает путь поля сериализатора, выполняющего запрос."""
+    names = []
+    frame = sys._getframe(2)
+    while frame is not None:
+        field = frame.f_locals.get('self')
+        if (
+            isinstance(field, serializers.Field)
+            and field.field_name
+            and frame.f_code.co_name in ('to_representation', 'get_attribute')
+            and (not names or names[-1] != field.field_name)
+        ):
+            names.append(field.field_name)
+        frame = frame.f_back
+    return '.'.join(reversed(names)) or '<view>'
+
+
+class QueryAttribution:
+    """Считает запросы к базе по полям сериализаторов."""
+
+    def __init__(self):
+        self.fields = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        self.fields[field_path()] += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = (
+        "Check that every API endpoint stays within its query budget "
+        "on a seeded dataset in a separate test database and an "
+        "in-memory cache."
+    )
+
+    def handle(self, *args, **options):
+        failures = []
+        try:
+            with test_environment(), transaction.atomic():
+                context = self.seed()
+                failures = self.check_budgets(context)
+                raise RollbackError
+        except RollbackError:
+            pass
+        if failures:
+            raise CommandError(
+                f'Превышен бюджет запросов: {len(failures)} адрес(ов).'
+            )
+        self.stdout.write(self.style.SUCCESS('All query budgets are met'))
+
+    def seed(self):
+        """Заполняет базу реалистичным набором данных."""
+        User.objects.bulk_create(
+            User(
+                username=f'budget_user_{i}', email=f'budget{i}@example.com',
+                first_name='Имя', last_name='Фамилия', password='!'
+            )
+            for i in range(USERS_COUNT)
+        )
+        users = list(User.objects.filter(username__startswith='budget_user_'))
+        Tag.objects.bulk_create(
+            Tag(name=f'Тег {i}', slug=f'budget-tag-{i}', color='#E26C2D')
+            for i in range(TAGS_COUNT)
+        )
+        tags = list(Tag.objects.filter(slug__startswith='budget-tag-'))
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'ингредиент {i}', measurement_unit='г')
+            for i in range(INGREDIENTS_COUNT)
+        )
+        ingredients = list(
+            Ingredient.objects.filter(name__startswith='ингредиент ')
+        )
+        Recipe.objects.bulk_create(
+            Recipe(
+                author=users[i % USERS_COUNT], name=f'Рецепт {i}',
+                text='Описание', cooking_time=10,
+                image='recipes/images/budget.jpg'
+            )
+            for i in range(RECIPES_COUNT)
+        )
+        recipes = list(Recipe.objects.filter(name__startswith='Рецепт '))
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe=recipe, tag=tags[(i + j) % TAGS_COUNT])
+            for i, recipe in enumerate(recipes)
+            for j in range(2)
+        )
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe, amount=j + 1,
+                ingredient=ingredients[(i + j) % INGREDIENTS_COUNT]
+            )
+            for i, recipe in enumerate(recipes)
+            for j in range(INGREDIENTS_PER_RECIPE)
+        )
+        Follow.objects.bulk_create(
+            Follow(user=user, author=users[(i + j) % USERS_COUNT])
+            for i, user in enumerate(users)
+            for j in range(1, FOLLOWS_PER_USER + 1)
+        )
+        for user in users:
+            backfill(user, list(user.follower.values_list(
+                'author_id', flat=True
+            )))
+        Favorite.objects.bulk_create(
+            Favorite(user=user, recipe=recipes[(i * 7 + j) % RECIPES_COUNT])
+            for i, user in enumerate(users)
+            for j in range(FAVORITES_PER_USER)
+        )
+        Cart.objects.bulk_create(
+            Cart(user=user, recipe=recipes[(i * 11 + j) % RECIPES_COUNT])
+            for i, user in enumerate(users)
+            for j in range(CART_PER_USER)
+        )
+        ShoppingListItem.objects.rebuild()
+        user = users[0]
+        return {
+            'token': Token.objects.create(user=user).key,
+            'tag': tags[0].id,
+            'tag_slug': tags[0].slug,
+            'ingredient': ingredients[0].id,
+            'recipe': recipes[0].id,
+            'author': user.id,
+            'since': (timezone.now() - timedelta(days=1)).strftime(
+                '%Y-%m-%dT%H:%M:%SZ'
+            ),
+        }
+
+    def check_budgets(self, context):
+        """Проверяет число запросов на каждом адресе."""
+        anonymous = APIClient()
+        authorized = APIClient()
+        authorized.credentials(HTTP_AUTHORIZATION=f'Token {context["token"]}')
+        failures = []
+        for url, is_authorized, budget, paginated in BUDGETS:
+            client = authorized if is_authorized else anonymous
+            url = url.format(**context)
+            page_sizes = PAGE_SIZES if paginated else (None,)
+            # Прогрев кэшей процесса: измеряется установившийся режим.
+            client.get(url)
+            counts = []
+            for page_size in page_sizes:
+                page_url = url
+                if page_size is not None:
+                    separator = '&' if '?' in url else '?'
+                    page_url = f'{url}{separator}limit={page_size}'
+                counts.append(self.measure(
+                    client, page_url, is_authorized, budget, failures
+                ))
+            if len(set(counts)) > 1:
+                failures.append(url)
+                self.stdout.write(self.style.ERROR(
+                    f'{url}: число запросов зависит от размера страницы '
+                    f'{dict(zip(page_sizes, counts))}'
+                ))
+        return failures
+
+    def measure(self, client, url, is_authorized, budget, failures):
+        """Выполняет запрос и сообщает о превышении бюджета."""
+        attribution = QueryAttribution()
+        # Кэш ответов устаревает, чтобы измерять сериализацию; версии
+        # тегов и ингредиентов сохраняются, как между обычными запросами.
+        response_cache.invalidate_all()
+        response_cache.invalidate_lists()
+        with CaptureQueriesContext(connection) as queries:
+            with connection.execute_wrapper(attribution):
+                response = client.get(url)
+                # Потоковые ответы выполняют запросы при чтении тела.
+                if response.streaming:
+                    b''.join(response.streaming_content)
+        count = len(queries)
+        label = 'auth' if is_authorized else 'anon'
+        if response.status_code >= 400:
+            failures.append(url)
+            self.stdout.write(self.style.ERROR(
+                f'{url} [{label}]: статус ответа {response.status_code}'
+            ))
+        elif count > budget:
+            failures.append(url)
+            self.stdout.write(self.style.ERROR(
+                f'{url} [{label}]: {count} запросов при бюджете {budget}'
+            ))
+            for field, field_count in attribution.fields.most_common():
+                self.stdout.write(f'    {field}: {field_count}')
+        else:
+            self.stdout.write(f'{url} [{label}]: {count}/{budget}')
+        return count
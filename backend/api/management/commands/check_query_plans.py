@@ -0,0 +1,262 @@
+import re
+
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import RequestFactory
+
+from api.filters import RecipeFilter
+from api.management.commands.check_query_budgets import (RollbackError,
+                                                         test_environment)
+from recipes.models import (Cart, Favorite, FeedEntry, Ingredient, Recipe,
+                            RecipeIngredient, Tag)
+from users.models import Follow, User
+
+USERS_COUNT = 2000
+RECIPES_COUNT = 20000
+INGREDIENTS_COUNT = 2000
+TAGS_COUNT = 6
+INGREDIENTS_PER_RECIPE = 4
+FOLLOWS_PER_USER = 20
+FAVORITES_PER_USER = 20
+CART_PER_USER = 5
+FEED_PER_USER = 20
+BATCH_SIZE = 2000
+PAGE_SIZE = 6
+
+# Полный проход по таблице в плане запроса.
+FULL_SCAN_PATTERNS = {
+    'postgresql': re.compile(r'Seq Scan on (\w+)'),
+    'sqlite': re.compile(r'\bSCAN (\w+)(?: AS \w+)?$', re.MULTILINE),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Run EXPLAIN for the hot API queries on a large seeded dataset "
+        "and fail if any of them scans a whole table. Runs in a "
+        "separate test database."
+    )
+
+    def handle(self, *args, **options):
+        pattern = FULL_SCAN_PATTERNS.get(connection.vendor)
+        if pattern is None:
+            raise CommandError(
+                f'Планы запросов {connection.vendor} не поддерживаются.'
+            )
+        failures = []
+        try:
+            with test_environment(), transaction.atomic():
+                context = self.seed()
+                with connection.cursor() as cursor:
+                    cursor.execute('ANALYZE')
+                failures = self.check_plans(
+                    context, pattern, options['verbosity']
+                )
+                raise RollbackError
+        except RollbackError:
+            pass
+        if failures:
+            raise CommandError(
+                f'Полный проход по таблице: {len(failures)} запрос(ов).'
+            )
+        self.stdout.write(self.style.SUCCESS('All hot queries use indexes'))
+
+    def seed(self):
+        """Заполняет базу объёмом, при котором важны индексы."""
+        User.objects.bulk_create(
+            (
+                User(
+                    username=f'plan_user_{i}', email=f'plan{i}@example.com',
+                    first_name='Имя', last_name='Фамилия', password='!'
+                )
+                for i in range(USERS_COUNT)
+            ),
+            batch_size=BATCH_SIZE
+        )
+        users = list(User.objects.filter(
+            username__startswith='plan_user_'
+        ).values_list('id', flat=True))
+        Tag.objects.bulk_create(
+            Tag(name=f'План {i}', slug=f'plan-tag-{i}', color='#E26C2D')
+            for i in range(TAGS_COUNT)
+        )
+        tags = list(Tag.objects.filter(
+            slug__startswith='plan-tag-'
+        ).values_list('id', flat=True))
+        Ingredient.objects.bulk_create(
+            (
+                Ingredient(name=f'продукт {i}', measurement_unit='г')
+                for i in range(INGREDIENTS_COUNT)
+            ),
+            batch_size=BATCH_SIZE
+        )
+        ingredients = list(Ingredient.objects.filter(
+            name__startswith='продукт '
+        ).values_list('id', flat=True))
+        Recipe.objects.bulk_create(
+            (
+                Recipe(
+                    author_id=users[i % USERS_COUNT], name=f'План {i}',
+                    text='Описание', cooking_time=10,
+                    image='recipes/images/plan.jpg',
+                    image_variants={'small': {}} if i % 100 else {},
+                )
+                for i in range(RECIPES_COUNT)
+            ),
+            batch_size=BATCH_SIZE
+        )
+        recipes = list(Recipe.objects.filter(
+            name__startswith='План '
+        ).values_list('id', 'author_id', 'pub_date'))
+        recipe_ids = [recipe[0] for recipe in recipes]
+        Recipe.tags.through.objects.bulk_create(
+            (
+                Recipe.tags.through(
+                    recipe_id=recipe_id, tag_id=tags[(i + j) % TAGS_COUNT]
+                )
+                for i, recipe_id in enumerate(recipe_ids)
+                for j in range(2)
+            ),
+            batch_size=BATCH_SIZE
+        )
+        RecipeIngredient.objects.bulk_create(
+            (
+                RecipeIngredient(
+                    recipe_id=recipe_id, amount=j + 1,
+                    ingredient_id=ingredients[(i + j) % INGREDIENTS_COUNT]
+                )
+                for i, recipe_id in enumerate(recipe_ids)
+                for j in range(INGREDIENTS_PER_RECIPE)
+            ),
+            batch_size=BATCH_SIZE
+        )
+        Follow.objects.bulk_create(
+            (
+                Follow(user_id=user, author_id=users[(i + j) % USERS_COUNT])
+                for i, user in enumerate(users)
+                for j in range(1, FOLLOWS_PER_USER + 1)
+            ),
+            batch_size=BATCH_SIZE
+        )
+        for model, per_user, step in (
+            (Favorite, FAVORITES_PER_USER, 7), (Cart, CART_PER_USER, 11)
+        ):
+            model.objects.bulk_create(
+                (
+                    model(
+                        user_id=user,
+                        recipe_id=recipe_ids[(i * step + j) % RECIPES_COUNT]
+                    )
+                    for i, user in enumerate(users)
+                    for j in range(per_user)
+                ),
+                batch_size=BATCH_SIZE
+            )
+        FeedEntry.objects.bulk_create(
+            (
+                FeedEntry(
+                    user_id=user, recipe_id=recipe_id,
+                    author_id=author_id, pub_date=pub_date
+                )
+                for i, user in enumerate(users)
+                for recipe_id, author_id, pub_date in recipes[
+                    i * FEED_PER_USER % RECIPES_COUNT:
+                ][:FEED_PER_USER]
+            ),
+            batch_size=BATCH_SIZE
+        )
+        user = User.objects.get(pk=users[0])
+        request = RequestFactory().get('/api/recipes/')
+        request.user = user
+        return {
+            'user': user,
+            'request': request,
+            'tag_slug': 'plan-tag-0',
+            'authors': users[1:PAGE_SIZE + 1],
+            'recipe_ids': recipe_ids[:PAGE_SIZE],
+        }
+
+    def hot_queries(self, context):
+        """Запросы списка рецептов, подписок, ленты и автодополнения."""
+        user, request = context['user'], context['request']
+
+        def recipe_filter(**data):
+            return RecipeFilter(
+                data, queryset=Recipe.objects.select_related('author'),
+                request=request
+            ).qs[:PAGE_SIZE]
+
+        return {
+            'recipes by author': recipe_filter(author=str(user.id)),
+            'recipes by tag': recipe_filter(tags=[context['tag_slug']]),
+            'favorited recipes': recipe_filter(is_favorited='1'),
+            'recipes in shopping cart': recipe_filter(is_in_shopping_cart='1'),
+            'subscriptions': Follow.objects.filter(
+                user=user
+            ).select_related('author').order_by('-author_id')[:PAGE_SIZE],
+            'subscription recipes': Recipe.objects.filter(
+                author_id__in=context['authors']
+            ).limited_per_author(3),
+            'user favorites flags': user.favorites.filter(
+                recipe_id__in=context['recipe_ids']
+            ).values_list('recipe_id', flat=True),
+            'recipe cart counts': Cart.objects.filter(
+                recipe_id__in=context['recipe_ids']
+            ).values('recipe_id').annotate(count=Count('id')).order_by(),
+            'subscription feed': FeedEntry.objects.filter(
+                user=user
+            ).order_by('-pub_date', '-recipe_id')[:PAGE_SIZE],
+            'pending recipe images': Recipe.objects.exclude(
+                image=''
+            ).exclude(image__isnull=True).filter(
+                image_variants={}
+            ).values_list('id', 'image'),
+        }
+
+    def vendor_queries(self):
+        """Запросы, индексы которых есть только в PostgreSQL."""
+        if connection.vendor != 'postgresql':
+            return {}
+        return {
+            'ingredient name prefix': Ingredient.objects.filter(
+                name__startswith='продукт 1'
+            )[:10],
+        }
+
+    def explain(self, queryset):
+        """План запроса по итоговому SQL.
+
+        QuerySet.explain() не поддерживает фильтры по оконным функциям,
+        поэтому префикс EXPLAIN добавляется к готовому запросу.
+        """
+        sql, params = queryset.query.get_compiler(queryset.db).as_sql()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'{connection.ops.explain_query_prefix()} {sql}', params
+            )
+            return '\n'.join(str(row[-1]) for row in cursor.fetchall())
+
+    def check_plans(self, context, pattern, verbosity):
+        """Ищет в планах полные проходы по таблицам базы.
+
+        Проходы по подзапросам и временным результатам не считаются.
+        """
+        failures = []
+        tables = set(connection.introspection.table_names())
+        queries = self.hot_queries(context)
+        queries.update(self.vendor_queries())
+        for name, queryset in queries.items():
+            plan = self.explain(queryset)
+            scanned = sorted(set(pattern.findall(plan)) & tables)
+            if scanned:
+                failures.append(name)
+                self.stdout.write(self.style.ERROR(
+                    f'{name}: полный проход по {", ".join(scanned)}'
+                ))
+                self.stdout.write(plan)
+                continue
+            self.stdout.write(f'{name}: ok')
+            if verbosity > 1:
+                self.stdout.write(plan)
+        return failures
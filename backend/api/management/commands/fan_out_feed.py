@@ -0,0 +1,30 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management import BaseCommand
+from django.utils import timezone
+
+from recipes.feed import fan_out_to_all
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        "Fan out recent recipes of authors with many followers, "
+        "for example after a restart dropped queued jobs"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=24)
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.filter(
+            pub_date__gte=timezone.now() - timedelta(hours=options['hours']),
+            author__followers_count__gt=settings.FEED_FANOUT_MAX_FOLLOWERS
+        ).values_list('id', 'author_id', 'pub_date')
+        recipes = list(recipes)
+        for entry in recipes:
+            fan_out_to_all(entry)
+        self.stdout.write(
+            self.style.SUCCESS(f'Fanned out recipes: {len(recipes)}')
+        )
@@ -1,39 +1,174 @@
-import os
 import csv
+import io
+import json
+import re
+from collections import Counter
+from itertools import islice
 
-import django
 from django.conf import settings
-from django.core.management import BaseCommand
-from django.db.utils import IntegrityError
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
 
+from api import cache
+from recipes.caches import bump_version
 from recipes.models import Ingredient
+from recipes.search import INGREDIENTS_VERSION
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.foodgram.settings')
+BATCH_SIZE = 5000
+JSON_CHUNK_SIZE = 1 << 16
+# Объект ингредиента намного меньше: если столько данных не разобрать,
+# JSON некорректен, и читать файл дальше бессмысленно.
+JSON_MAX_PENDING = 4 * JSON_CHUNK_SIZE
+JSON_SEPARATORS = re.compile(r'[\s,]*')
+FORMATS = ('csv', 'json')
 
-django.setup()
+
+def iter_json_array(file):
+    """Объекты JSON-массива по одному, без чтения файла целиком.
+
+    Неразобранный остаток буфера не превышает JSON_MAX_PENDING.
+    """
+    decoder = json.JSONDecoder()
+    buffer = file.read(JSON_CHUNK_SIZE).lstrip()
+    if not buffer.startswith('['):
+        raise CommandError('Ожидается JSON-массив объектов.')
+    position = 1
+    while True:
+        position = JSON_SEPARATORS.match(buffer, position).end()
+        if buffer.startswith(']', position):
+            return
+        try:
+            item, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError as error:
+            if len(buffer) - position > JSON_MAX_PENDING:
+                raise CommandError(f'Некорректный JSON: {error}.')
+            chunk = file.read(JSON_CHUNK_SIZE)
+            if not chunk:
+                raise CommandError('Некорректный JSON в конце файла.')
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield item
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        yield row if len(row) == 2 else None
+
+
+def read_json(file):
+    for item in iter_json_array(file):
+        if not isinstance(item, dict):
+            yield None
+            continue
+        row = item.get('name'), item.get('measurement_unit')
+        yield row if all(isinstance(value, str) for value in row) else None
+
+
+READERS = {'csv': read_csv, 'json': read_json}
+
+
+def batches(rows, size):
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
 
 
 class Command(BaseCommand):
-    help = "Load data from csv file"
+    help = (
+        "Import ingredients from a CSV (name,measurement_unit) or JSON "
+        "file in batches. Pairs that already exist are skipped, so the "
+        "import can be re-run safely"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?',
+            default=settings.BASE_DIR / 'data' / 'ingredients.csv',
+            help='Файл с ингредиентами, по умолчанию data/ingredients.csv.'
+        )
+        parser.add_argument(
+            '--format', choices=FORMATS,
+            help='Формат файла, по умолчанию определяется по расширению.'
+        )
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument(
+            '--copy', action='store_true',
+            help='Загрузка через COPY во временную таблицу (PostgreSQL).'
+        )
 
-    def handle(self, *args, **kwargs):
+    def handle(self, *args, **options):
+        path = str(options['path'])
+        file_format = options['format'] or path.rsplit('.', 1)[-1].lower()
+        if file_format not in FORMATS:
+            raise CommandError(
+                'Не удалось определить формат файла, укажите --format.'
+            )
+        if options['copy'] and connection.vendor != 'postgresql':
+            raise CommandError('COPY доступен только для PostgreSQL.')
+        stats = Counter()
         try:
-            with open(
-                    f"{settings.BASE_DIR}/data/ingredients.csv", "r",
-                    encoding="utf-8"
-            ) as csv_file:
-                reader = csv.reader(csv_file)
-                objects = (
-                    Ingredient(name=data[0], measurement_unit=data[1])
-                    for data in reader
-                )
-                Ingredient.objects.bulk_create(objects)
-        except IntegrityError:
-            pass
+            with open(path, encoding='utf-8', newline='') as file:
+                rows = self.clean(READERS[file_format](file), stats)
+                if options['copy']:
+                    self.copy(rows, options['batch_size'], stats)
+                else:
+                    self.insert(rows, options['batch_size'], stats)
         except FileNotFoundError:
-            raise Exception(
-                "Ошибка при импорте файла базы данных. "
-                "Проверьте наличие файла ingredients.csv "
-                f"по адресу: {settings.BASE_DIR}/data/"
+            raise CommandError(f'Файл {path} не найден.')
+        if stats['inserted']:
+            bump_version(INGREDIENTS_VERSION)
+            cache.invalidate_all()
+        self.stdout.write(self.style.SUCCESS(
+            f'Inserted: {stats["inserted"]}, '
+            f'existing: {stats["existing"]}, skipped: {stats["skipped"]}'
+        ))
+
+    def clean(self, rows, stats):
+        """Пары без лишних пробелов, некорректные строки пропускаются."""
+        max_length = settings.INGREDIENT_MAX_LENGTH
+        for row in rows:
+            if row is not None:
+                row = tuple(value.strip() for value in row)
+                if all(0 < len(value) <= max_length for value in row):
+                    yield row
+                    continue
+            stats['skipped'] += 1
+
+    def insert(self, rows, batch_size, stats):
+        """Вставка пачками, каждая пачка - отдельная транзакция."""
+        max_params = connection.features.max_query_params
+        if max_params:
+            batch_size = min(batch_size, max_params // 2)
+        for batch in batches(rows, batch_size):
+            inserted = Ingredient.objects.insert_missing(batch)
+            stats['inserted'] += inserted
+            stats['existing'] += len(batch) - inserted
+
+    def copy(self, rows, batch_size, stats):
+        """COPY во временную таблицу и одна вставка недостающих пар."""
+        table = connection.ops.quote_name(Ingredient._meta.db_table)
+        total = 0
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMPORARY TABLE ingredient_import '
+                '(name text, measurement_unit text) ON COMMIT DROP'
+            )
+            for batch in batches(rows, batch_size):
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(batch)
+                buffer.seek(0)
+                cursor.copy_expert(
+                    'COPY ingredient_import FROM STDIN WITH (FORMAT csv)',
+                    buffer
+                )
+                total += len(batch)
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                'SELECT DISTINCT name, measurement_unit '
+                'FROM ingredient_import ON CONFLICT DO NOTHING'
             )
-        self.stdout.write(self.style.SUCCESS("Successfully load data"))
+            stats['inserted'] += cursor.rowcount
+        stats['existing'] += total - stats['inserted']
@@ -0,0 +1,22 @@
+from django.core.management import BaseCommand
+
+from recipes.images import process_image
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        "Process recipe images that have no resized variants yet, "
+        "for example after a restart dropped queued jobs"
+    )
+
+    def handle(self, *args, **options):
+        pending = Recipe.objects.exclude(image='').exclude(
+            image__isnull=True
+        ).filter(image_variants={}).values_list('id', 'image')
+        pending = list(pending)
+        for recipe_id, name in pending:
+            process_image(recipe_id, name)
+        self.stdout.write(
+            self.style.SUCCESS(f'Processed images: {len(pending)}')
+        )
@@ -0,0 +1,60 @@
+from math import isclose
+
+from django.core.management import BaseCommand, CommandError
+
+from recipes.models import ShoppingListItem
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild aggregated shopping lists from carts "
+        "and verify them against a full recalculation"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Only compare stored shopping lists, do not rebuild.'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if not options['check']:
+            ShoppingListItem.objects.rebuild(batch_size=options['batch_size'])
+            self.stdout.write('Shopping lists rebuilt')
+        mismatches = self.verify()
+        if mismatches:
+            raise CommandError(
+                f'Списки покупок расходятся с корзинами: {mismatches} поз.'
+            )
+        self.stdout.write(self.style.SUCCESS('Shopping lists are consistent'))
+
+    def verify(self):
+        """Сравнивает сохранённые списки с полным пересчётом."""
+        expected = {
+            (row['user_id'], row['recipe__recipe_ingredients__ingredient_id']):
+                (row['total_amount'], row['recipes_count'])
+            for row in ShoppingListItem.objects.calculate().iterator()
+        }
+        stored = {
+            (item['user_id'], item['ingredient_id']):
+                (item['total_amount'], item['recipes_count'])
+            for item in ShoppingListItem.objects.values(
+                'user_id', 'ingredient_id', 'total_amount', 'recipes_count'
+            ).iterator()
+        }
+        mismatches = 0
+        for key in expected.keys() | stored.keys():
+            expected_total, expected_count = expected.get(key, (0, 0))
+            stored_total, stored_count = stored.get(key, (0, 0))
+            if expected_count != stored_count or not isclose(
+                expected_total, stored_total, rel_tol=1e-9, abs_tol=1e-6
+            ):
+                mismatches += 1
+                user_id, ingredient_id = key
+                self.stdout.write(self.style.ERROR(
+                    f'user={user_id} ingredient={ingredient_id}: '
+                    f'ожидается {expected_total} ({expected_count}), '
+                    f'сохранено {stored_total} ({stored_count})'
+                ))
+        return mismatches
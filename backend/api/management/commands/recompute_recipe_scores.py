@@ -0,0 +1,24 @@
+from django.core.management import BaseCommand
+
+from api import cache
+from recipes.ranking import SCORES_BATCH_SIZE, recompute_scores
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalculate popularity and trending scores of all recipes. "
+        "Meant to run periodically, e.g. from cron"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=SCORES_BATCH_SIZE,
+            help='Количество рецептов в одном UPDATE.'
+        )
+
+    def handle(self, *args, **options):
+        processed = recompute_scores(options['batch_size'])
+        cache.invalidate_lists()
+        self.stdout.write(
+            self.style.SUCCESS(f'Recalculated scores: {processed}')
+        )
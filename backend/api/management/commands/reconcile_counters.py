@@ -0,0 +1,54 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import Favorite, Recipe
+from users.models import Follow, User
+
+# (модель со счётчиком, счётчик, модель связи, поле связи)
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Follow, 'author'),
+)
+
+
+def actual_count(model, field):
+    """Подзапрос с фактическим числом связанных строк."""
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')}).order_by().values(
+            field
+        ).annotate(count=Count('pk')).values('count')
+    ), 0)
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalculate denormalized counters that drifted from the rows "
+        "they count, e.g. after raw SQL or bulk operations"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать число расхождений.'
+        )
+
+    def handle(self, *args, **options):
+        for model, counter, related_model, field in COUNTERS:
+            actual = actual_count(related_model, field)
+            with transaction.atomic():
+                drifted = model.objects.annotate(actual=actual).exclude(
+                    **{counter: F('actual')}
+                ).values('pk')
+                if options['dry_run']:
+                    fixed = drifted.count()
+                else:
+                    fixed = model.objects.filter(pk__in=drifted).update(
+                        **{counter: actual}
+                    )
+            self.stdout.write(
+                f'{model._meta.model_name}.{counter}: {fixed} out of sync'
+            )
+        self.stdout.write(self.style.SUCCESS('Counters are reconciled'))
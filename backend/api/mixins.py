@@ -0,0 +1,65 @@
+import hashlib
+
+from django.utils.cache import quote_etag
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.response import Response
+
+
+class NotModified(APIException):
+    status_code = status.HTTP_304_NOT_MODIFIED
+
+
+class ConditionalGetMixin:
+    """Условные GET-запросы по ETag.
+
+    ETag вычисляется по дешёвой отметке версии данных после проверки
+    прав, но до выборки и сериализации. При совпадении с If-None-Match
+    ответ 304 возвращается без обращения к обработчику.
+    """
+    conditional_actions = ('list', 'retrieve')
+    etag = None
+
+    def get_etag_parts(self, request, *args, **kwargs):
+        """Отметка версии данных ответа, None отключает ETag."""
+
+    def get_etag(self, request, *args, **kwargs):
+        parts = self.get_etag_parts(request, *args, **kwargs)
+        if parts is None:
+            return None
+        raw = repr((
+            self.action, kwargs, request.get_host(),
+            sorted(request.query_params.lists()), parts,
+        ))
+        return quote_etag(hashlib.md5(raw.encode()).hexdigest())
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if (
+            request.method not in ('GET', 'HEAD')
+            or self.action not in self.conditional_actions
+        ):
+            return
+        self.etag = self.get_etag(request, *args, **kwargs)
+        if_none_match = request.headers.get('If-None-Match')
+        if self.etag and if_none_match and self.etag in parse_etags(
+            if_none_match
+        ):
+            raise NotModified
+
+    def handle_exception(self, exc):
+        if isinstance(exc, NotModified):
+            return Response(
+                status=status.HTTP_304_NOT_MODIFIED,
+                headers={'ETag': self.etag},
+            )
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+        if self.etag and response.status_code == status.HTTP_200_OK:
+            response['ETag'] = self.etag
+        return response
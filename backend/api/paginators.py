@@ -1,6 +1,128 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (BasePagination, CursorPagination,
+                                       PageNumberPagination)
+
+from recipes.ranking import ORDERINGS
+from recipes.search import SEARCH_ORDERING
 
 
 class PageLimitPagination(PageNumberPagination):
     page_size = 6
     page_size_query_param = 'limit'
+
+
+class CursorLimitPagination(CursorPagination):
+    """Курсор по значениям всех полей сортировки.
+
+    Штатный курсор DRF фильтрует только по первому полю, а совпадения
+    пропускает смещением не больше offset_cutoff, и на тысячах равных
+    оценок зацикливается. Последнее поле сортировки уникально,
+    поэтому позиция однозначна и смещение не нужно.
+    """
+    page_size = 6
+    page_size_query_param = 'limit'
+
+    def decode_cursor(self, request):
+        """Курсор без позиции: по ней фильтрует paginate_queryset."""
+        cursor = super().decode_cursor(request)
+        if cursor is None:
+            return None
+        return cursor._replace(position=None)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        cursor = super().decode_cursor(request)
+        if cursor is None or cursor.position is None:
+            return super().paginate_queryset(queryset, request, view)
+        position = cursor.position
+        self.ordering = self.get_ordering(request, queryset, view)
+        super().paginate_queryset(
+            self.filter_after(queryset, position, cursor.reverse),
+            request, view
+        )
+        self.cursor = cursor
+        if cursor.reverse:
+            self.has_next, self.next_position = True, position
+        else:
+            self.has_previous, self.previous_position = True, position
+        return self.page
+
+    def filter_after(self, queryset, position, reverse):
+        """Строки после позиции курсора в порядке сортировки."""
+        try:
+            values = json.loads(position)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        condition = Q()
+        equal = {}
+        for order, value in zip(self.ordering, values):
+            field = order.lstrip('-')
+            lookup = 'lt' if order.startswith('-') != reverse else 'gt'
+            condition |= Q(**equal, **{f'{field}__{lookup}': value})
+            equal[field] = value
+        try:
+            return queryset.filter(condition)
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def _get_position_from_instance(self, instance, ordering):
+        return json.dumps([
+            str(getattr(instance, order.lstrip('-'))) for order in ordering
+        ])
+
+
+class PageOrCursorPagination(BasePagination):
+    """Постраничная пагинация, по запросу - курсорная.
+
+    Курсорный режим включается параметром pagination=cursor
+    или наличием параметра cursor и не выполняет COUNT и OFFSET.
+    """
+    mode_query_param = 'pagination'
+    cursor_ordering = None
+
+    def get_cursor_ordering(self, request):
+        return self.cursor_ordering
+
+    def get_paginator(self, request):
+        query_params = request.query_params
+        if (
+            CursorLimitPagination.cursor_query_param in query_params
+            or query_params.get(self.mode_query_param) == 'cursor'
+        ):
+            paginator = CursorLimitPagination()
+            paginator.ordering = self.get_cursor_ordering(request)
+            return paginator
+        return PageLimitPagination()
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.paginator = self.get_paginator(request)
+        return self.paginator.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+
+class RecipePagination(PageOrCursorPagination):
+    cursor_ordering = ('-pub_date', '-id')
+
+    def get_cursor_ordering(self, request):
+        """Курсор по той же сортировке, что и фильтры списка."""
+        query_params = request.query_params
+        if query_params.get('ordering') in ORDERINGS:
+            return ORDERINGS[query_params['ordering']]
+        if query_params.get('search', '').strip():
+            return SEARCH_ORDERING
+        return self.cursor_ordering
+
+
+class FollowPagination(PageOrCursorPagination):
+    cursor_ordering = ('-author_id',)
+
+
+class FeedPagination(PageOrCursorPagination):
+    cursor_ordering = ('-pub_date', '-recipe_id')
@@ -0,0 +1,60 @@
+from django.http import Http404
+from rest_framework.negotiation import BaseContentNegotiation
+from rest_framework.renderers import BaseRenderer
+from rest_framework.settings import api_settings
+
+
+class ShoppingListRenderer(BaseRenderer):
+    """Базовый рендерер списка покупок.
+
+    Сам список отдаётся потоком из представления, рендерер нужен
+    для выбора формата и вывода ошибок.
+    """
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict):
+            return '\n'.join(f'{key}: {value}' for key, value in data.items())
+        return data
+
+
+class TextShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+
+class CSVShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class PDFShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'application/pdf'
+    format = 'pdf'
+
+
+class FormatParamNegotiation(BaseContentNegotiation):
+    """Выбирает рендерер только по параметру format.
+
+    Заголовок Accept игнорируется: без параметра используется
+    первый рендерер из списка.
+    """
+
+    def select_parser(self, request, parsers):
+        return parsers[0] if parsers else None
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        format_query = format_suffix or request.query_params.get(
+            api_settings.URL_FORMAT_OVERRIDE
+        )
+        if format_query is None:
+            renderer = renderers[0]
+        else:
+            matches = [
+                renderer for renderer in renderers
+                if renderer.format == format_query
+            ]
+            if not matches:
+                raise Http404
+            renderer = matches[0]
+        return renderer, renderer.media_type
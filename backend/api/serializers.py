@@ -1,8 +1,14 @@
-from drf_extra_fields.fields import Base64ImageField
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
 from rest_framework import serializers, status
 
+from api.fields import RawBase64ImageField
+from recipes.caches import tag_cache
+from recipes.feed import fan_out_recipe
+from recipes.images import schedule_image_processing
 from recipes.models import (Cart, Favorite, Ingredient, Recipe,
-                            RecipeIngredient, Tag)
+                            RecipeIngredient, ShoppingListItem, Tag)
 from users.models import Follow, User
 
 
@@ -21,8 +27,10 @@ class UserSerializer(serializers.ModelSerializer):
     def get_is_subscribed(self, obj):
         """Проверяет подписку на текущего пользователя."""
         user = self.context.get('request').user
-        if user.is_anonymous:
+        if user.is_anonymous or self.context.get('shared'):
             return False
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         return user.follower.filter(author=obj).exists()
 
     def create(self, validated_data):
@@ -58,12 +66,36 @@ class IngredientSerializer(serializers.ModelSerializer):
         read_only_fields = ('id', 'name', 'measurement_unit')
 
 
+def image_variant_urls(request, variants):
+    """Адреса уменьшенных копий фотографии по размерам и форматам."""
+    urls = {}
+    for size, paths in variants.items():
+        urls[size] = {}
+        for extension, path in paths.items():
+            url = default_storage.url(path)
+            if request is not None:
+                url = request.build_absolute_uri(url)
+            urls[size][extension] = url
+    return urls
+
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    """Адреса уменьшенных копий фотографии рецепта.
+
+    Пустой словарь, пока фотография обрабатывается.
+    """
+
+    def to_representation(self, value):
+        return image_variant_urls(self.context.get('request'), value)
+
+
 class ShortRecipeSerializer(serializers.ModelSerializer):
     """Сериализатор для отображения рецептов в FollowSerializer."""
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
 
 
 class FollowSerializer(serializers.ModelSerializer):
@@ -75,7 +107,7 @@ class FollowSerializer(serializers.ModelSerializer):
     last_name = serializers.ReadOnlyField(source='author.last_name')
     is_subscribed = serializers.BooleanField(default=True, read_only=True)
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
+    recipes_count = serializers.ReadOnlyField(source='author.recipes_count')
 
     class Meta:
         model = Follow
@@ -86,21 +118,15 @@ class FollowSerializer(serializers.ModelSerializer):
 
     def get_recipes(self, obj):
         """Отображение рецептов."""
-        request = self.context.get('request')
-        recipes = obj.author.recipes.all()
-        recipes_limit = request.query_params.get('recipes_limit')
-        if recipes_limit:
-            try:
-                recipes = recipes[:int(recipes_limit)]
-            except ValueError:
-                raise serializers.ValidationError({
-                    'errors': 'recipes_limit должен быть числом'})
+        if hasattr(obj.author, 'limited_recipes'):
+            recipes = obj.author.limited_recipes
+        else:
+            recipes = obj.author.recipes.all()
+            recipes_limit = self.context.get('recipes_limit')
+            if recipes_limit is not None:
+                recipes = recipes[:recipes_limit]
         return ShortRecipeSerializer(recipes, many=True).data
 
-    def get_recipes_count(self, obj):
-        """Отображение количества рецептов."""
-        return obj.author.recipes.count()
-
 
 class RecipeIngredientSerializer(serializers.ModelSerializer):
     """Сериализатор связной модели RecipeIngredient."""
@@ -127,35 +153,40 @@ class RecipeListSerializer(serializers.ModelSerializer):
     )
     is_favorited = serializers.SerializerMethodField(read_only=True)
     is_in_shopping_cart = serializers.SerializerMethodField(read_only=True)
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
         fields = (
             'id', 'tags', 'author', 'ingredients', 'is_favorited',
-            'is_in_shopping_cart', 'name', 'image', 'text', 'cooking_time'
+            'is_in_shopping_cart', 'name', 'image', 'image_variants',
+            'text', 'cooking_time'
         )
 
     def get_is_favorited(self, obj):
         """Проверяет авторизацию при добавлении рецепта."""
         user = self.context.get('request').user
-        if user.is_anonymous:
+        if user.is_anonymous or self.context.get('shared'):
             return False
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         return user.favorites.filter(recipe=obj).exists()
 
     def get_is_in_shopping_cart(self, obj):
         """Проверяет авторизацию при добавлении в корзину."""
         user = self.context.get('request').user
-        if user.is_anonymous:
+        if user.is_anonymous or self.context.get('shared'):
             return False
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         return user.cart_recipe.filter(recipe=obj).exists()
 
 
 class RecipeCreateSerializer(serializers.ModelSerializer):
     """Сериализатор создания рецептов."""
     ingredients = RecipeIngredientSerializer(many=True)
-    tags = serializers.PrimaryKeyRelatedField(many=True,
-                                              queryset=Tag.objects.all())
-    image = Base64ImageField(required=False)
+    tags = serializers.ListField(child=serializers.IntegerField())
+    image = RawBase64ImageField(required=False)
 
     class Meta:
         model = Recipe
@@ -194,23 +225,90 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         tags = validated_data.pop("tags")
         request_user = self.context["request"].user
         ingredients = validated_data.pop("ingredients")
-        new_recipe = Recipe.objects.create(
-            author=request_user, **validated_data
-        )
-
-        self.create_new_ingredients(new_recipe, ingredients)
-        new_recipe.tags.add(*tags)
+        with transaction.atomic():
+            new_recipe = Recipe.objects.create(
+                author=request_user, **validated_data
+            )
+            self.create_new_ingredients(new_recipe, ingredients)
+            new_recipe.tags.add(*tags)
+            fan_out_recipe(new_recipe)
+        if new_recipe.image:
+            schedule_image_processing(new_recipe)
         return new_recipe
 
+    def update_ingredients(self, recipe, ingredients):
+        """Применяет к ингредиентам рецепта только разницу с текущими.
+
+        Возвращает количества ингредиентов до и после изменения.
+        """
+        current = {
+            row.ingredient_id: row
+            for row in RecipeIngredient.objects.select_for_update().filter(
+                recipe=recipe
+            )
+        }
+        old_amounts = {
+            ingredient_id: row.amount for ingredient_id, row in current.items()
+        }
+        new_amounts = {
+            ingredient['ingredient']['id']: ingredient['amount']
+            for ingredient in ingredients
+        }
+        changed = []
+        for ingredient_id in current.keys() & new_amounts.keys():
+            row = current[ingredient_id]
+            if row.amount != new_amounts[ingredient_id]:
+                row.amount = new_amounts[ingredient_id]
+                changed.append(row)
+        added = new_amounts.keys() - current.keys()
+        removed = current.keys() - new_amounts.keys()
+        if added:
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe=recipe, ingredient_id=ingredient_id,
+                    amount=new_amounts[ingredient_id]
+                )
+                for ingredient_id in added
+            )
+        if changed:
+            RecipeIngredient.objects.bulk_update(changed, ['amount'])
+        if removed:
+            RecipeIngredient.objects.filter(
+                recipe=recipe, ingredient_id__in=removed
+            ).delete()
+        return old_amounts, new_amounts
+
     def update(self, instance: Recipe, validated_data):
-        """Обновление рецепта."""
-        RecipeIngredient.objects.filter(recipe=instance).delete()
-        self.create_new_ingredients(
-            instance, validated_data.pop("ingredients")
-        )
+        """Обновление рецепта: меняются только изменившиеся строки."""
+        ingredients = validated_data.pop("ingredients")
         tags = validated_data.pop("tags")
-        instance.tags.set(tags, clear=True)
-        return super().update(instance, validated_data)
+        with transaction.atomic():
+            old_amounts, new_amounts = self.update_ingredients(
+                instance, ingredients
+            )
+            ShoppingListItem.objects.change_recipe_ingredients(
+                instance, old_amounts, new_amounts
+            )
+            instance.tags.set(tags)
+            if 'image' in validated_data:
+                validated_data['image_variants'] = {}
+            recipe = super().update(instance, validated_data)
+            if 'image' in validated_data and recipe.image:
+                schedule_image_processing(recipe)
+            return recipe
+
+    def validate_tags(self, value):
+        """Проверяет теги по кэшу тегов процесса, без запросов к базе."""
+        if len(set(value)) != len(value):
+            raise serializers.ValidationError(
+                'Указано несколько одинаковых тегов.'
+            )
+        missing = tag_cache.missing_ids(value)
+        if missing:
+            raise serializers.ValidationError(
+                f'Теги не существуют: {", ".join(map(str, missing))}.'
+            )
+        return value
 
     def validate(self, value):
         """Валидация данных при создании и обновлении рецепта."""
@@ -219,19 +317,25 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(
                 'Список ингредиентов не может быть пустым.'
             )
-        ingredients_id_list = []
+        ingredient_ids = set()
         for item in ingredients:
             if item['amount'] == 0:
                 raise serializers.ValidationError(
                     'Количество ингредиента не может быть равным нулю.'
                 )
-            # Access `ingredient.id` instead of just `id`
-            ingredient_id = item.get('ingredient', {}).get('id')
-            if ingredient_id in ingredients_id_list:
-                raise serializers.ValidationError(
-                    'Указано несколько одинаковых ингредиентов.'
-                )
-            ingredients_id_list.append(ingredient_id)
+            ingredient_ids.add(item['ingredient']['id'])
+        if len(ingredient_ids) != len(ingredients):
+            raise serializers.ValidationError(
+                'Указано несколько одинаковых ингредиентов.'
+            )
+        missing = ingredient_ids - set(Ingredient.objects.filter(
+            id__in=ingredient_ids
+        ).values_list('id', flat=True))
+        if missing:
+            raise serializers.ValidationError(
+                'Ингредиенты не существуют: '
+                f'{", ".join(map(str, sorted(missing)))}.'
+            )
         return value
 
 
@@ -270,3 +374,12 @@ class CartSerializer(serializers.ModelSerializer):
                 code=status.HTTP_400_BAD_REQUEST,
             )
         return data
+
+
+class BulkIdsSerializer(serializers.Serializer):
+    """Список id для массового добавления и удаления."""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.BULK_ACTION_MAX_ITEMS,
+    )
@@ -0,0 +1,98 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from rest_framework.authtoken.models import Token
+
+from api import cache
+from api.authentication import USER_FIELDS, token_cache
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+from users.models import User
+
+
+# Поля, от которых не зависят фильтры, поиск и сортировка списков.
+LIST_NEUTRAL_FIELDS = {'image_variants', 'updated_at'}
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def invalidate_recipe(sender, instance, update_fields=None, **kwargs):
+    """Сбрасывает кэш ответов по изменённому рецепту.
+
+    Списки сбрасываются при любом изменении, влияющем на поиск
+    и фильтры: закэшированный список мог рецепт не содержать.
+    """
+    recipe_ids = [instance.pk]
+    transaction.on_commit(lambda: cache.invalidate_recipes(recipe_ids))
+    if update_fields is None or not set(update_fields) <= LIST_NEUTRAL_FIELDS:
+        transaction.on_commit(cache.invalidate_lists)
+
+
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+def invalidate_recipe_ingredients(sender, instance, **kwargs):
+    """Сбрасывает кэш ответов по рецепту с изменённым составом."""
+    recipe_ids = [instance.recipe_id]
+    transaction.on_commit(lambda: cache.invalidate_recipes(recipe_ids))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipe_tags(sender, instance, action, reverse, pk_set,
+                           **kwargs):
+    """Сбрасывает кэш рецептов с изменёнными тегами и списков."""
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        if pk_set is None:
+            transaction.on_commit(cache.invalidate_all)
+            return
+        recipe_ids = list(pk_set)
+    else:
+        recipe_ids = [instance.pk]
+    transaction.on_commit(lambda: cache.invalidate_recipes(recipe_ids))
+    transaction.on_commit(cache.invalidate_lists)
+
+
+@receiver((post_save, post_delete), sender=Tag)
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_dictionaries(sender, **kwargs):
+    """Сбрасывает весь кэш ответов после изменения тегов и ингредиентов."""
+    transaction.on_commit(cache.invalidate_all)
+
+
+@receiver((post_save, post_delete), sender=User)
+def invalidate_author_recipes(sender, instance, update_fields=None,
+                              **kwargs):
+    """Сбрасывает кэш ответов по рецептам изменённого автора."""
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    recipe_ids = list(
+        Recipe.objects.filter(author_id=instance.pk).values_list(
+            'id', flat=True
+        )
+    )
+    if recipe_ids:
+        transaction.on_commit(lambda: cache.invalidate_recipes(recipe_ids))
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_token(sender, instance, **kwargs):
+    """Убирает токен из кэша авторизации после выхода пользователя."""
+    keys = [instance.key]
+    transaction.on_commit(lambda: token_cache.invalidate(keys))
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_tokens(sender, instance, update_fields=None, **kwargs):
+    """Убирает токены изменённого или деактивированного пользователя.
+
+    Снимок пользователя в кэше авторизации должен совпадать с базой,
+    поэтому сохранение других полей токены не трогает.
+    """
+    if update_fields is not None and set(update_fields).isdisjoint(
+        USER_FIELDS
+    ):
+        return
+    keys = list(Token.objects.filter(user_id=instance.pk).values_list(
+        'key', flat=True
+    ))
+    if keys:
+        transaction.on_commit(lambda: token_cache.invalidate(keys))
@@ -1,18 +1,23 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from api.views import (FollowAPIView, FollowViewSet, IngredientViewSet,
-                       RecipeViewSet, TagViewSet)
+from api.views import (FollowAPIView, FollowBulkAPIView, FollowViewSet,
+                       IngredientViewSet, RecipeViewSet, TagViewSet,
+                       UserViewSet)
 
 router = DefaultRouter()
 router.register(r'tags', TagViewSet, basename='tags')
 router.register(r'recipes', RecipeViewSet, basename='recipe')
 router.register(r'ingredients', IngredientViewSet, basename='ingredients')
 router.register('users/subscriptions', FollowViewSet, basename='subscriptions')
+router.register('users', UserViewSet, basename='user')
 
 urlpatterns = [
+    path(
+        'users/subscribe/', FollowBulkAPIView.as_view(),
+        name='subscribe-bulk'
+    ),
     path('', include(router.urls)),
-    path('', include('djoser.urls')),
     path('auth/', include('djoser.urls.authtoken')),
     path(
         'users/<int:author_id>/subscribe/',
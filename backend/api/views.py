@@ -1,49 +1,215 @@
-from django.db.models import Sum
-from django.http import HttpResponse
+import heapq
+import json
+from contextlib import nullcontext
+from operator import itemgetter
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.db.models import (Exists, OuterRef, Prefetch,
+                              prefetch_related_objects)
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.functional import cached_property
+from django.utils.dateparse import parse_datetime
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import status, viewsets
+from djoser.views import UserViewSet as DjoserUserViewSet
+from rest_framework import serializers, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
 from rest_framework.views import APIView
 
-from api.filters import CustomSearchFilter, RecipeFilter
-from api.paginators import PageLimitPagination
+from api import cache
+from api.exporters import EXPORTERS
+from api.filters import RecipeFilter
+from api.mixins import ConditionalGetMixin
+from api.paginators import FeedPagination, FollowPagination, RecipePagination
 from api.permissions import IsAuthorOrAdminOrReadOnly
-from api.serializers import (CartSerializer, FavoriteSerializer,
-                             FollowSerializer, IngredientSerializer,
-                             RecipeCreateSerializer, RecipeListSerializer,
-                             TagSerializer)
+from api.renderers import (CSVShoppingListRenderer, FormatParamNegotiation,
+                           PDFShoppingListRenderer, TextShoppingListRenderer)
+from api.serializers import (BulkIdsSerializer, CartSerializer,
+                             FavoriteSerializer, FollowSerializer,
+                             IngredientSerializer, RecipeCreateSerializer,
+                             RecipeListSerializer, TagSerializer)
+from recipes.caches import TAGS_VERSION, get_version
+from recipes.feed import backfill, feed_entries, prune
 from recipes.models import (Cart, Favorite, Ingredient, Recipe,
-                            RecipeIngredient, Tag)
+                            RecipeTombstone, ShoppingListItem, Tag)
+from recipes.search import INGREDIENTS_VERSION, ingredient_index
 from users.models import Follow, User
 
+SHOPPING_LIST_CHUNK_SIZE = 500
+CHANGES_CHUNK_SIZE = 100
+
+
+async def iterate_in_thread(chunks):
+    """Отдаёт синхронный поток по частям в асинхронном контексте."""
+    next_chunk = sync_to_async(next, thread_sensitive=True)
+    chunks = iter(chunks)
+    while (chunk := await next_chunk(chunks, None)) is not None:
+        yield chunk
+
+
+def streaming_response(request, chunks, **kwargs):
+    """Потоковый ответ, который и под ASGI не собирается в памяти.
+
+    Под ASGI синхронный итератор Django читает целиком,
+    поэтому он оборачивается в асинхронный.
+    """
+    if isinstance(request._request, ASGIRequest):
+        chunks = iterate_in_thread(chunks)
+    return StreamingHttpResponse(chunks, **kwargs)
+
+
+def get_since(request):
+    """Момент времени из обязательного параметра since.
+
+    Удаления известны только за срок хранения отметок, поэтому более
+    ранний since отклоняется: клиенту нужно заново получить список
+    рецептов через /api/recipes/.
+    """
+    since = request.query_params.get('since')
+    if not since:
+        raise serializers.ValidationError(
+            {'errors': 'Параметр since обязателен.'}
+        )
+    try:
+        value = parse_datetime(since)
+    except ValueError:
+        value = None
+    if value is None:
+        raise serializers.ValidationError(
+            {'errors': 'Параметр since должен быть датой и временем ISO 8601.'}
+        )
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    if value < RecipeTombstone.objects.horizon():
+        raise serializers.ValidationError({'errors': (
+            'Параметр since не может быть раньше чем '
+            f'{settings.RECIPE_TOMBSTONE_RETENTION_DAYS} дней назад.'
+        )})
+    return value
+
+
+def get_recipes_limit(query_params):
+    """Проверяет параметр recipes_limit до сериализации подписок."""
+    recipes_limit = query_params.get('recipes_limit')
+    if recipes_limit is None:
+        return None
+    try:
+        recipes_limit = int(recipes_limit)
+    except ValueError:
+        raise serializers.ValidationError({
+            'errors': 'recipes_limit должен быть числом'})
+    if recipes_limit < 0:
+        raise serializers.ValidationError({
+            'errors': 'recipes_limit не может быть отрицательным'})
+    return recipes_limit
+
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+def subscriptions(user, recipes_limit):
+    """Подписки пользователя с последними рецептами каждого автора."""
+    return Follow.objects.filter(user=user).select_related(
+        'author'
+    ).prefetch_related(
+        Prefetch(
+            'author__recipes',
+            queryset=Recipe.objects.limited_per_author(recipes_limit),
+            to_attr='limited_recipes'
+        )
+    ).order_by('-author_id')
+
+
+def get_ingredients_limit(query_params):
+    """Проверяет параметр limit автодополнения ингредиентов."""
+    limit = query_params.get('limit')
+    if limit is None:
+        return None
+    try:
+        limit = int(limit)
+    except ValueError:
+        raise serializers.ValidationError({
+            'errors': 'limit должен быть числом'})
+    if limit < 1:
+        raise serializers.ValidationError({
+            'errors': 'limit должен быть больше нуля'})
+    return limit
+
+
+def get_bulk_ids(request):
+    """Уникальные id из тела массового запроса в исходном порядке."""
+    serializer = BulkIdsSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    return list(dict.fromkeys(serializer.validated_data['ids']))
+
+
+def bulk_response(ids, statuses):
+    """Результат массового действия для каждого переданного id."""
+    return Response({'results': [
+        {'id': pk, 'status': statuses.get(pk, 'not_found')} for pk in ids
+    ]})
+
+
+class UserViewSet(DjoserUserViewSet):
+    """Viewset пользователей с аннотацией подписки."""
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        user = self.request.user
+        if user.is_anonymous:
+            return queryset
+        return queryset.annotate(
+            is_subscribed=Exists(
+                Follow.objects.filter(user=user, author=OuterRef('pk'))
+            )
+        )
+
+
+class TagViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     """Viewset тегов."""
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (AllowAny,)
 
+    def get_etag_parts(self, request, *args, **kwargs):
+        return get_version(TAGS_VERSION)
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+
+class IngredientViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     """Viewset ингредиентов."""
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
-    filter_backends = (CustomSearchFilter,)
-    search_fields = ('^name',)
+
+    def get_etag_parts(self, request, *args, **kwargs):
+        return get_version(INGREDIENTS_VERSION)
+
+    def list(self, request, *args, **kwargs):
+        """Автодополнение по индексу в памяти, без запросов к базе."""
+        return Response(ingredient_index.search(
+            request.query_params.get('name', ''),
+            get_ingredients_limit(request.query_params)
+        ))
 
 
 class FollowViewSet(viewsets.ModelViewSet):
     """Viewset просмотра подписок."""
     serializer_class = FollowSerializer
     permission_classes = [IsAuthenticated, ]
-    pagination_class = PageLimitPagination
+    pagination_class = FollowPagination
 
     def get_queryset(self):
-        return Follow.objects.filter(
-            user=self.request.user).prefetch_related('author')
+        return subscriptions(
+            self.request.user, get_recipes_limit(self.request.query_params)
+        )
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['recipes_limit'] = get_recipes_limit(self.request.query_params)
+        return context
 
 
 class FollowAPIView(APIView):
@@ -56,24 +222,30 @@ class FollowAPIView(APIView):
             return self.response_error(
                 'Вы не можете подписаться на самого себя.'
             )
-
-        if Follow.objects.filter(author=author, user=request.user).exists():
+        recipes_limit = get_recipes_limit(request.query_params)
+        with transaction.atomic():
+            created = Follow.objects.link(request.user, [author.id])
+            backfill(request.user, list(created))
+        if not created:
             return self.response_error('Вы уже подписаны на этого автора.')
 
-        follow = Follow.objects.create(author=author, user=request.user)
-
-        serializer = FollowSerializer(follow, context={'request': request})
+        follow = Follow(
+            id=created[author.id], author=author, user=request.user
+        )
+        serializer = FollowSerializer(
+            follow,
+            context={'request': request, 'recipes_limit': recipes_limit}
+        )
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def delete(self, request, author_id):
-        author = get_object_or_404(User, id=author_id)
-
-        if not Follow.objects.filter(
-                author=author, user=request.user).exists():
-            return self.response_error('Вы еще не подписаны на этого автора.')
-
-        Follow.objects.filter(author=author, user=request.user).delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        with transaction.atomic():
+            deleted = Follow.objects.unlink(request.user, [author_id])
+            prune(request.user, deleted)
+        if deleted:
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        get_object_or_404(User, id=author_id)
+        return self.response_error('Вы еще не подписаны на этого автора.')
 
     def response_error(self, message):
         return Response(
@@ -82,30 +254,193 @@ class FollowAPIView(APIView):
         )
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class FollowBulkAPIView(APIView):
+    """Массовая подписка и отписка по списку id авторов."""
+    permission_classes = [IsAuthenticated, ]
+
+    def post(self, request):
+        ids = get_bulk_ids(request)
+        user = request.user
+        found = self.get_authors(ids) - {user.id}
+        with transaction.atomic():
+            created = Follow.objects.link(user, sorted(found))
+            backfill(user, list(created))
+        statuses = {
+            pk: 'created' if pk in created else 'exists' for pk in found
+        }
+        if user.id in ids:
+            statuses[user.id] = 'self'
+        return bulk_response(ids, statuses)
+
+    def delete(self, request):
+        ids = get_bulk_ids(request)
+        found = self.get_authors(ids)
+        with transaction.atomic():
+            deleted = Follow.objects.unlink(request.user, sorted(found))
+            prune(request.user, deleted)
+        deleted = set(deleted)
+        return bulk_response(ids, {
+            pk: 'deleted' if pk in deleted else 'not_exists' for pk in found
+        })
+
+    def get_authors(self, ids):
+        return set(User.objects.filter(
+            id__in=ids
+        ).values_list('id', flat=True))
+
+
+class RecipeViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """Viewset рецептов."""
     queryset = Recipe.objects.all()
     serializer_class = RecipeListSerializer
-    pagination_class = PageLimitPagination
+    pagination_class = RecipePagination
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
     permission_classes = (IsAuthorOrAdminOrReadOnly,)
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'list':
+            return queryset.select_related('author')
+        if self.action == 'retrieve':
+            return queryset.with_related().with_user_flags(self.request.user)
+        return queryset
+
     def get_serializer_class(self):
         if self.request.method in ['POST', 'PUT', 'PATCH']:
             return RecipeCreateSerializer
         return RecipeListSerializer
 
-    def recipe_action(self, request, pk, model, serializer_class):
-        recipe = get_object_or_404(Recipe, id=pk)
+    def get_etag_parts(self, request, *args, **kwargs):
+        """Версии из кэша ответов и флаги пользователя для рецепта."""
         user = request.user
-        if request.method == 'POST':
-            instance, created = model.objects.get_or_create(
-                user=user, recipe=recipe
+        if self.action == 'list':
+            if user.is_authenticated:
+                return None
+            if self.cached_list is not None:
+                return self.cached_list['stamp']
+            return cache.get_list_stamp()
+        stamp = cache.get_recipe_stamp(kwargs[self.lookup_field])
+        if stamp is None or user.is_anonymous:
+            return stamp
+        flags = Recipe.objects.filter(
+            pk=kwargs[self.lookup_field]
+        ).values_list(
+            Exists(Favorite.objects.filter(user=user, recipe=OuterRef('pk'))),
+            Exists(Cart.objects.filter(user=user, recipe=OuterRef('pk'))),
+            Exists(Follow.objects.filter(
+                user=user, author=OuterRef('author')
+            )),
+        ).first()
+        return user.id, stamp, flags
+
+    def list(self, request, *args, **kwargs):
+        """Список рецептов из кэша общих частей и флагов пользователя.
+
+        Анонимные ответы целиком берутся из кэша ответов.
+        """
+        is_anonymous = request.user.is_anonymous
+        if is_anonymous and self.cached_list is not None:
+            return Response(self.cached_list['data'])
+        stamp = cache.get_list_stamp()
+        page = self.paginate_queryset(
+            self.filter_queryset(self.get_queryset())
+        )
+        response = self.get_paginated_response(
+            self.serialize_page(page, stamp[1])
+        )
+        if is_anonymous:
+            cache.set_list(request, response.data, stamp)
+        return response
+
+    @cached_property
+    def cached_list(self):
+        """Сохранённый анонимный список, один поиск на запрос."""
+        if self.request.user.is_authenticated:
+            return None
+        return cache.get_list(self.request)
+
+    def serialize_page(self, recipes, changes):
+        """Собирает рецепты из общих частей и флагов пользователя.
+
+        changes - токен изменений, прочитанный до выборки рецептов.
+        """
+        request = self.request
+        fragments = cache.get_fragments(
+            request, [recipe.id for recipe in recipes]
+        )
+        missing = [recipe for recipe in recipes if recipe.id not in fragments]
+        if missing:
+            prefetch_related_objects(
+                missing, *Recipe.objects.related_lookups()
             )
+            context = self.get_serializer_context()
+            context['shared'] = True
+            serialized = {
+                item['id']: item for item in RecipeListSerializer(
+                    missing, many=True, context=context
+                ).data
+            }
+            cache.set_fragments(request, serialized, changes)
+            fragments.update(serialized)
+        favorites, carts, follows = self.get_user_flags(recipes)
+        data = []
+        for recipe in recipes:
+            item = dict(fragments[recipe.id])
+            item['author'] = dict(
+                item['author'], is_subscribed=recipe.author_id in follows
+            )
+            item['is_favorited'] = recipe.id in favorites
+            item['is_in_shopping_cart'] = recipe.id in carts
+            data.append(item)
+        return data
+
+    def get_user_flags(self, recipes):
+        """Избранное, корзина и подписки пользователя для страницы."""
+        user = self.request.user
+        if user.is_anonymous:
+            return set(), set(), set()
+        recipe_ids = [recipe.id for recipe in recipes]
+        author_ids = {recipe.author_id for recipe in recipes}
+        return (
+            set(user.favorites.filter(
+                recipe_id__in=recipe_ids
+            ).values_list('recipe_id', flat=True)),
+            set(user.cart_recipe.filter(
+                recipe_id__in=recipe_ids
+            ).values_list('recipe_id', flat=True)),
+            set(user.follower.filter(
+                author_id__in=author_ids
+            ).values_list('author_id', flat=True)),
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return super().retrieve(request, *args, **kwargs)
+        data = cache.get_detail(request, kwargs[self.lookup_field])
+        if data is not None:
+            return Response(data)
+        changes = cache.get_changes_token()
+        response = super().retrieve(request, *args, **kwargs)
+        cache.set_detail(
+            request, response.data['id'], response.data, changes
+        )
+        return response
+
+    def recipe_action(self, request, pk, model, serializer_class,
+                      on_add=None, on_remove=None):
+        """Добавляет или удаляет рецепт одним запросом к таблице связи."""
+        user = request.user
+        if request.method == 'POST':
+            recipe = get_object_or_404(Recipe, id=pk)
+            with transaction.atomic() if on_add else nullcontext():
+                created = model.objects.link(user, [recipe.id])
+                if created and on_add is not None:
+                    on_add(user, [recipe.id])
             if created:
                 serializer = serializer_class(
-                    instance, context={'request': request}
+                    model(id=created[recipe.id], user=user, recipe=recipe),
+                    context={'request': request}
                 )
                 return Response(
                     serializer.data,
@@ -117,17 +452,50 @@ class RecipeViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        instance = model.objects.filter(user=user, recipe=recipe)
-        if instance.exists():
-            instance.delete()
+        try:
+            recipe_id = int(pk)
+        except ValueError:
+            raise Http404
+        with transaction.atomic() if on_remove else nullcontext():
+            deleted = model.objects.unlink(user, [recipe_id])
+            if deleted and on_remove is not None:
+                on_remove(user, deleted)
+        if deleted:
             return Response(status=status.HTTP_204_NO_CONTENT)
 
+        get_object_or_404(Recipe, id=recipe_id)
         return Response(
             {'detail': 'Не существует.'},
             status=status.HTTP_400_BAD_REQUEST
         )
 
-        return Response(status=status.HTTP_405_METHOD_NOT_ALLOWED)
+    def bulk_recipe_action(self, request, model,
+                           on_add=None, on_remove=None):
+        """Добавляет или удаляет несколько рецептов за один запрос.
+
+        Рецепты проверяются одним запросом с IN, связи меняются
+        одним запросом, который возвращает изменённые строки.
+        """
+        ids = get_bulk_ids(request)
+        user = request.user
+        found = sorted(Recipe.objects.filter(
+            id__in=ids
+        ).values_list('id', flat=True))
+        with transaction.atomic():
+            if request.method == 'POST':
+                changed = list(model.objects.link(user, found))
+                callback, statuses = on_add, ('created', 'exists')
+            else:
+                changed = model.objects.unlink(user, found)
+                callback, statuses = on_remove, ('deleted', 'not_exists')
+            if changed and callback is not None:
+                callback(user, changed)
+        changed_status, unchanged_status = statuses
+        changed = set(changed)
+        return bulk_response(ids, {
+            pk: changed_status if pk in changed else unchanged_status
+            for pk in found
+        })
 
     @action(
         detail=True,
@@ -136,7 +504,11 @@ class RecipeViewSet(viewsets.ModelViewSet):
         permission_classes=[IsAuthenticated],
     )
     def shopping_cart(self, request, pk=None):
-        return self.recipe_action(request, pk, Cart, CartSerializer)
+        return self.recipe_action(
+            request, pk, Cart, CartSerializer,
+            on_add=ShoppingListItem.objects.add_recipes,
+            on_remove=ShoppingListItem.objects.remove_recipes,
+        )
 
     @action(
         detail=True,
@@ -147,32 +519,123 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def favorite(self, request, pk=None):
         return self.recipe_action(request, pk, Favorite, FavoriteSerializer)
 
+    @action(
+        detail=False,
+        methods=['POST', 'DELETE'],
+        url_path='shopping_cart',
+        url_name='shopping-cart-bulk',
+        permission_classes=[IsAuthenticated],
+    )
+    def shopping_cart_bulk(self, request):
+        return self.bulk_recipe_action(
+            request, Cart,
+            on_add=ShoppingListItem.objects.add_recipes,
+            on_remove=ShoppingListItem.objects.remove_recipes,
+        )
+
+    @action(
+        detail=False,
+        methods=['POST', 'DELETE'],
+        url_path='favorite',
+        url_name='favorite-bulk',
+        permission_classes=[IsAuthenticated],
+    )
+    def favorite_bulk(self, request):
+        return self.bulk_recipe_action(request, Favorite)
+
+    @action(
+        detail=False,
+        methods=['GET'],
+        url_path='feed',
+        permission_classes=[IsAuthenticated],
+        pagination_class=FeedPagination,
+    )
+    def feed(self, request):
+        """Рецепты авторов, на которых подписан пользователь."""
+        changes = cache.get_changes_token()
+        page = self.paginate_queryset(feed_entries(request.user))
+        return self.get_paginated_response(
+            self.serialize_page([entry.recipe for entry in page], changes)
+        )
+
+    @action(
+        detail=False,
+        methods=['GET'],
+        url_path='changes',
+        permission_classes=[AllowAny],
+    )
+    def changes(self, request):
+        """Лента изменённых и удалённых рецептов в формате NDJSON.
+
+        Строки упорядочены по времени изменения, начиная с since.
+        """
+        since = get_since(request)
+        recipes = self.get_queryset().with_related().with_user_flags(
+            request.user
+        ).filter(updated_at__gte=since).order_by('updated_at', 'id')
+        tombstones = RecipeTombstone.objects.filter(
+            deleted_at__gte=since
+        ).order_by('deleted_at', 'id')
+        return streaming_response(
+            request, self.stream_changes(recipes, tombstones),
+            content_type='application/x-ndjson',
+        )
+
+    def stream_changes(self, recipes, tombstones):
+        context = self.get_serializer_context()
+        updated = (
+            (recipe.updated_at, {
+                'type': 'updated',
+                'id': recipe.id,
+                'timestamp': recipe.updated_at,
+                'recipe': RecipeListSerializer(recipe, context=context).data,
+            })
+            for recipe in recipes.iterator(chunk_size=CHANGES_CHUNK_SIZE)
+        )
+        deleted = (
+            (tombstone.deleted_at, {
+                'type': 'deleted',
+                'id': tombstone.recipe_id,
+                'timestamp': tombstone.deleted_at,
+            })
+            for tombstone in tombstones.iterator(chunk_size=CHANGES_CHUNK_SIZE)
+        )
+        for _, change in heapq.merge(
+            updated, deleted, key=itemgetter(0)
+        ):
+            yield json.dumps(
+                change, cls=JSONEncoder, ensure_ascii=False,
+                separators=(',', ':'),
+            ) + '\n'
+
     @action(
         detail=False,
         methods=['GET'],
         url_path='download_shopping_cart',
         permission_classes=[IsAuthenticated],
+        renderer_classes=[
+            TextShoppingListRenderer,
+            CSVShoppingListRenderer,
+            PDFShoppingListRenderer,
+        ],
+        content_negotiation_class=FormatParamNegotiation,
     )
     def download_shopping_cart(self, request):
-        list_ingredients = (
-            RecipeIngredient.objects.filter(
-                recipe__cart_recipe__user=request.user)
-            .values('ingredient__name', 'ingredient__measurement_unit')
-            .annotate(total_amount=Sum('amount'))
-        )
-        shop_list = ['Список покупок\n\n']
-        for ingredient in list_ingredients:
-            total_amount = ingredient['total_amount']
-            name = ingredient['ingredient__name']
-            measurement_unit = ingredient['ingredient__measurement_unit']
-            shop_list.append(
-                f"{name} - {total_amount} {measurement_unit}\n"
+        export_format = request.accepted_renderer.format
+        ingredients = (
+            ShoppingListItem.objects.filter(user=request.user)
+            .values(
+                'ingredient__name', 'ingredient__measurement_unit',
+                'total_amount'
             )
-
-        return HttpResponse(
-            shop_list,
-            {
-                "Content-Type": "text/plain",
-                "Content-Disposition": 'attachment; filename="shop_list.txt"',
-            },
+            .order_by('ingredient__name')
+            .iterator(chunk_size=SHOPPING_LIST_CHUNK_SIZE)
+        )
+        response = streaming_response(
+            request, EXPORTERS[export_format](ingredients),
+            content_type=request.accepted_media_type,
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="shop_list.{export_format}"'
         )
+        return response
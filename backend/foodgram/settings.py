@@ -23,6 +23,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'django_filters',
     'api.apps.ApiConfig',
@@ -76,6 +77,29 @@ DATABASES = {
     }
 }
 
+# Локально достаточно кэша в памяти процесса. С несколькими процессами
+# версии данных и кэш ответов должны быть общими (проверка api.W001).
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    }
+}
+
+RECIPE_RESPONSE_CACHE_TIMEOUT = int(
+    os.environ.get('RECIPE_RESPONSE_CACHE_TIMEOUT', 300)
+)
+
+AUTH_TOKEN_CACHE_TIMEOUT = int(
+    os.environ.get('AUTH_TOKEN_CACHE_TIMEOUT', 300)
+)
+AUTH_TOKEN_CACHE_SIZE = int(os.environ.get('AUTH_TOKEN_CACHE_SIZE', 10000))
+AUTH_TOKEN_VERSION_INTERVAL = float(
+    os.environ.get('AUTH_TOKEN_VERSION_INTERVAL', 5)
+)
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -97,7 +121,7 @@ REST_FRAMEWORK = {
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
 }
 
@@ -132,6 +156,16 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+RECIPE_IMAGE_WORKERS = int(os.environ.get('RECIPE_IMAGE_WORKERS', 2))
+RECIPE_IMAGE_MAX_SIZE = int(
+    os.environ.get('RECIPE_IMAGE_MAX_SIZE', 10 * 1024 * 1024)
+)
+# Столько дней хранятся отметки об удалении рецептов, since в ленте
+# изменений не может быть раньше.
+RECIPE_TOMBSTONE_RETENTION_DAYS = int(
+    os.environ.get('RECIPE_TOMBSTONE_RETENTION_DAYS', 30)
+)
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'users.User'
@@ -142,3 +176,10 @@ TAG_MAX_LENGTH = 200
 COLOR_MAX_LENGTH = 7
 INGREDIENT_MAX_LENGTH = 200
 RECIPE_MAX_LENGTH = 200
+BULK_ACTION_MAX_ITEMS = 100
+
+# Рецепты авторов с большим числом подписчиков раскладываются в фоне.
+FEED_FANOUT_MAX_FOLLOWERS = int(
+    os.environ.get('FEED_FANOUT_MAX_FOLLOWERS', 1000)
+)
+FEED_BACKFILL_SIZE = int(os.environ.get('FEED_BACKFILL_SIZE', 50))
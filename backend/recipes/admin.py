@@ -1,6 +1,14 @@
 from django.contrib import admin
+from django.db import transaction
 
-from .models import Ingredient, Recipe, RecipeIngredient, Tag
+from .models import Ingredient, Recipe, RecipeIngredient, ShoppingListItem, Tag
+
+
+def ingredient_amounts(recipe):
+    """Количества ингредиентов рецепта по id ингредиента."""
+    return dict(RecipeIngredient.objects.select_for_update().filter(
+        recipe=recipe
+    ).values_list('ingredient_id', 'amount'))
 
 
 class IngredientInLine(admin.TabularInline):
@@ -21,6 +29,17 @@ class RecipeAdmin(admin.ModelAdmin):
     ]
     list_filter = ('author', 'name', 'tags',)
 
+    def save_related(self, request, form, formsets, change):
+        """Переносит правку ингредиентов в списки покупок, как и API."""
+        recipe = form.instance
+        with transaction.atomic():
+            old_amounts = ingredient_amounts(recipe) if change else {}
+            super().save_related(request, form, formsets, change)
+            if change:
+                ShoppingListItem.objects.change_recipe_ingredients(
+                    recipe, old_amounts, ingredient_amounts(recipe)
+                )
+
     @admin.display(description='Теги')
     def get_tags(self, obj):
         """Отображает в админке теги каждого рецепта."""
@@ -35,10 +54,10 @@ class RecipeAdmin(admin.ModelAdmin):
             f"{i}" for i in obj.ingredients.values_list('name', flat=True)
         )
 
-    @admin.display(description='В избранном')
+    @admin.display(description='В избранном', ordering='favorites_count')
     def get_in_favorited(self, obj):
         """Отображает в админке кол-во добавлений рецепта в избранное."""
-        return obj.in_favorites.all().count()
+        return obj.favorites_count
 
 
 class IngredientAdmin(admin.ModelAdmin):
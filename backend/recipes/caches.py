@@ -0,0 +1,74 @@
+import threading
+import time
+
+from django.core.cache import cache
+
+VERSION_KEY = 'recipes:version:{}'
+TAGS_VERSION = 'tags'
+
+
+def get_version(name):
+    """Текущая версия набора данных, общая для всех процессов.
+
+    Начальное значение берётся от времени, чтобы после очистки кэша
+    версии не повторяли уже выданные.
+    """
+    key = VERSION_KEY.format(name)
+    version = cache.get(key)
+    if version is None:
+        version = time.time_ns()
+        if not cache.add(key, version, timeout=None):
+            return cache.get(key)
+    return version
+
+
+def bump_version(name):
+    """Увеличивает версию набора данных после его изменения."""
+    key = VERSION_KEY.format(name)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        version = time.time_ns()
+        cache.set(key, version, timeout=None)
+        return version
+
+
+class TagCache:
+    """Соответствие slug и id тегов в памяти процесса.
+
+    Перестраивается после изменения версии таблицы тегов.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._ids_by_slug = {}
+
+    def get_ids_by_slug(self):
+        version = get_version(TAGS_VERSION)
+        if self._version != version:
+            with self._lock:
+                if self._version != version:
+                    from recipes.models import Tag
+                    self._ids_by_slug = dict(
+                        Tag.objects.values_list('slug', 'id')
+                    )
+                    self._version = version
+        return self._ids_by_slug
+
+    def ids_for_slugs(self, slugs):
+        ids_by_slug = self.get_ids_by_slug()
+        return [ids_by_slug[slug] for slug in slugs if slug in ids_by_slug]
+
+    def missing_ids(self, ids):
+        """Id из списка, которых нет среди тегов."""
+        existing = set(self.get_ids_by_slug().values())
+        return sorted(set(ids) - existing)
+
+
+tag_cache = TagCache()
+
+
+def tag_slug_choices():
+    """Варианты slug тегов для фильтров."""
+    return [(slug, slug) for slug in tag_cache.get_ids_by_slug()]
@@ -0,0 +1,104 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections, transaction
+
+from recipes.models import FeedEntry, Recipe
+from users.models import Follow
+
+logger = logging.getLogger(__name__)
+
+FEED_BATCH_SIZE = 1000
+
+executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='feed-fanout')
+
+
+def add_entries(user_ids, recipes):
+    """Добавляет рецепты в ленты пользователей, пропуская имеющиеся."""
+    FeedEntry.objects.bulk_create(
+        (
+            FeedEntry(
+                user_id=user_id, recipe_id=recipe_id,
+                author_id=author_id, pub_date=pub_date
+            )
+            for user_id in user_ids
+            for recipe_id, author_id, pub_date in recipes
+        ),
+        batch_size=FEED_BATCH_SIZE, ignore_conflicts=True
+    )
+
+
+def fan_out_recipe(recipe):
+    """Раскладывает новый рецепт по лентам подписчиков автора.
+
+    Рецепты авторов с числом подписчиков больше
+    FEED_FANOUT_MAX_FOLLOWERS раскладываются в фоне пачками
+    после коммита, чтобы не задерживать публикацию.
+    """
+    entry = (recipe.id, recipe.author_id, recipe.pub_date)
+    if recipe.author.followers_count > settings.FEED_FANOUT_MAX_FOLLOWERS:
+        transaction.on_commit(
+            lambda: executor.submit(fan_out_in_background, entry)
+        )
+        return
+    add_entries(
+        Follow.objects.filter(author_id=recipe.author_id).values_list(
+            'user_id', flat=True
+        ),
+        [entry]
+    )
+
+
+def follower_batches(author_id):
+    """Id подписчиков автора пачками по FEED_BATCH_SIZE."""
+    last_id = 0
+    while True:
+        batch = list(Follow.objects.filter(
+            author_id=author_id, user_id__gt=last_id
+        ).order_by('user_id').values_list('user_id', flat=True)[
+            :FEED_BATCH_SIZE
+        ])
+        if not batch:
+            return
+        yield batch
+        last_id = batch[-1]
+
+
+def fan_out_to_all(entry):
+    """Раскладывает рецепт по лентам всех подписчиков пачками."""
+    for user_ids in follower_batches(entry[1]):
+        add_entries(user_ids, [entry])
+
+
+def fan_out_in_background(entry):
+    try:
+        fan_out_to_all(entry)
+    except Exception:
+        logger.exception('Ошибка раскладки рецепта %s по лентам', entry[0])
+    finally:
+        connections.close_all()
+
+
+def backfill(user, author_ids):
+    """Добавляет в ленту последние рецепты новых авторов подписки."""
+    if not author_ids:
+        return
+    add_entries([user.id], Recipe.objects.filter(
+        author_id__in=author_ids
+    ).limited_per_author(settings.FEED_BACKFILL_SIZE).values_list(
+        'id', 'author_id', 'pub_date'
+    ))
+
+
+def prune(user, author_ids):
+    """Убирает из ленты рецепты авторов, от которых пользователь отписался."""
+    if author_ids:
+        FeedEntry.objects.filter(user=user, author_id__in=author_ids).delete()
+
+
+def feed_entries(user):
+    """Лента пользователя от новых рецептов к старым."""
+    return FeedEntry.objects.filter(user=user).select_related(
+        'recipe__author'
+    ).order_by('-pub_date', '-recipe_id')
@@ -0,0 +1,127 @@
+import io
+import logging
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+VARIANTS_DIR = 'recipes/variants'
+VARIANT_WIDTHS = {
+    'small': 320,
+    'medium': 960,
+}
+VARIANT_FORMATS = {
+    'webp': 'WEBP',
+    'jpeg': 'JPEG',
+}
+VARIANT_QUALITY = 85
+# Оригинал без метаданных пересохраняется почти без потерь.
+ORIGINAL_QUALITY = 95
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.RECIPE_IMAGE_WORKERS,
+    thread_name_prefix='recipe-images',
+)
+
+
+def schedule_image_processing(recipe):
+    """Ставит обработку изображения рецепта в очередь после коммита."""
+    recipe_id, name = recipe.id, recipe.image.name
+    transaction.on_commit(
+        lambda: executor.submit(process_image, recipe_id, name)
+    )
+
+
+def encode(image, image_format, quality=VARIANT_QUALITY):
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, quality=quality)
+    return ContentFile(buffer.getvalue())
+
+
+def build_variants(name):
+    """Проверяет изображение, убирает метаданные и создаёт варианты.
+
+    Оригинал без EXIF и других метаданных сохраняется рядом под новым
+    именем, исходный файл не трогается. Возвращает путь нового
+    оригинала и пути вариантов по размерам и форматам.
+    """
+    with default_storage.open(name) as file:
+        data = file.read()
+    with Image.open(io.BytesIO(data)) as image:
+        image.verify()
+    with Image.open(io.BytesIO(data)) as source:
+        image_format = source.format
+        image = ImageOps.exif_transpose(source)
+        if image_format == 'JPEG':
+            image = image.convert('RGB')
+        original = default_storage.save(
+            name, encode(image, image_format, ORIGINAL_QUALITY)
+        )
+        image = image.convert('RGB')
+    stem = posixpath.splitext(posixpath.basename(name))[0]
+    variants = {}
+    for size, width in VARIANT_WIDTHS.items():
+        resized = image.copy()
+        resized.thumbnail((width, width * 4))
+        variants[size] = {
+            extension: default_storage.save(
+                f'{VARIANTS_DIR}/{stem}_{size}.{extension}',
+                encode(resized, image_format),
+            )
+            for extension, image_format in VARIANT_FORMATS.items()
+        }
+    return original, variants
+
+
+def save_result(recipe_id, name, original, variants):
+    """Сохраняет оригинал без метаданных и варианты.
+
+    Ничего не меняет, если изображение рецепта уже сменилось.
+    Без вариантов непрошедшее проверку изображение удаляется.
+    """
+    from recipes.models import Recipe
+
+    with transaction.atomic():
+        recipe = Recipe.objects.select_for_update().filter(
+            pk=recipe_id
+        ).first()
+        if recipe is None or recipe.image.name != name:
+            return False
+        if variants:
+            recipe.image = original
+            recipe.image_variants = variants
+        else:
+            recipe.image = None
+            recipe.image_variants = {}
+        recipe.save(update_fields=['image', 'image_variants', 'updated_at'])
+    return True
+
+
+def process_image(recipe_id, name):
+    """Фоновая обработка загруженного изображения рецепта."""
+    try:
+        try:
+            original, variants = build_variants(name)
+        except (OSError, UnidentifiedImageError, SyntaxError, ValueError):
+            logger.warning('Некорректное изображение рецепта %s', recipe_id)
+            if save_result(recipe_id, name, None, None):
+                default_storage.delete(name)
+            return
+        if save_result(recipe_id, name, original, variants):
+            if original != name:
+                default_storage.delete(name)
+            return
+        default_storage.delete(original)
+        for paths in variants.values():
+            for path in paths.values():
+                default_storage.delete(path)
+    except Exception:
+        logger.exception('Ошибка обработки изображения рецепта %s', recipe_id)
+    finally:
+        connections.close_all()
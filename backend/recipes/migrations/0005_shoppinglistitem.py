@@ -0,0 +1,91 @@
+# Generated by Django 4.2.1 on 2026-10-18 19:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def fill_shopping_lists(apps, schema_editor):
+    Cart = apps.get_model("recipes", "Cart")
+    ShoppingListItem = apps.get_model("recipes", "ShoppingListItem")
+    rows = (
+        Cart.objects.filter(recipe__recipe_ingredients__isnull=False)
+        .values("user_id", "recipe__recipe_ingredients__ingredient_id")
+        .annotate(
+            total_amount=Sum("recipe__recipe_ingredients__amount"),
+            recipes_count=Count("recipe_id"),
+        )
+        .order_by()
+    )
+    ShoppingListItem.objects.bulk_create(
+        (
+            ShoppingListItem(
+                user_id=row["user_id"],
+                ingredient_id=row["recipe__recipe_ingredients__ingredient_id"],
+                total_amount=row["total_amount"],
+                recipes_count=row["recipes_count"],
+            )
+            for row in rows
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("recipes", "0004_alter_cart_recipe_alter_cart_user_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ShoppingListItem",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("total_amount", models.FloatField(verbose_name="Общее количество")),
+                (
+                    "recipes_count",
+                    models.PositiveIntegerField(
+                        verbose_name="Число рецептов с ингредиентом"
+                    ),
+                ),
+                (
+                    "ingredient",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="shopping_list",
+                        to="recipes.ingredient",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="shopping_list",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Позиция списка покупок",
+                "verbose_name_plural": "Списки покупок",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="shoppinglistitem",
+            constraint=models.UniqueConstraint(
+                fields=("user", "ingredient"), name="unique_ingredient_in_shopping_list"
+            ),
+        ),
+        migrations.RunPython(fill_shopping_lists, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.operations import TrigramExtension
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+
+SEARCH_INDEXES = (
+    GinIndex(
+        fields=["name"],
+        opclasses=["gin_trgm_ops"],
+        name="recipe_name_trgm_idx",
+    ),
+    GinIndex(
+        SearchVector("text", config="russian"),
+        name="recipe_text_search_idx",
+    ),
+)
+
+
+def add_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    Recipe = apps.get_model("recipes", "Recipe")
+    for index in SEARCH_INDEXES:
+        schema_editor.add_index(Recipe, index)
+
+
+def remove_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    Recipe = apps.get_model("recipes", "Recipe")
+    for index in SEARCH_INDEXES:
+        schema_editor.remove_index(Recipe, index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0005_shoppinglistitem"),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunPython(add_search_indexes, remove_search_indexes),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 4.2.1 on 2026-10-18 19:22
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def fill_updated_at(apps, schema_editor):
+    Recipe = apps.get_model("recipes", "Recipe")
+    Recipe.objects.update(updated_at=F("pub_date"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0006_recipe_search_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RecipeTombstone",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("recipe_id", models.PositiveIntegerField(verbose_name="ID рецепта")),
+                (
+                    "deleted_at",
+                    models.DateTimeField(
+                        auto_now_add=True,
+                        db_index=True,
+                        verbose_name="Дата удаления рецепта",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Удалённый рецепт",
+                "verbose_name_plural": "Удалённые рецепты",
+                "ordering": ["deleted_at"],
+            },
+        ),
+        migrations.AddField(
+            model_name="recipe",
+            name="updated_at",
+            field=models.DateTimeField(
+                auto_now=True, db_index=True, verbose_name="Дата изменения рецепта"
+            ),
+        ),
+        migrations.RunPython(fill_updated_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.2.1 on 2026-10-18 19:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0007_recipe_updated_at_recipetombstone"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recipe",
+            name="image_variants",
+            field=models.JSONField(
+                blank=True, default=dict, verbose_name="Варианты фотографии"
+            ),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.1 on 2026-10-18 19:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0009_recipe_favorites_count"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recipe",
+            name="popularity",
+            field=models.PositiveIntegerField(default=0, verbose_name="Популярность"),
+        ),
+        migrations.AddField(
+            model_name="recipe",
+            name="trending_score",
+            field=models.FloatField(default=0, verbose_name="Оценка для трендов"),
+        ),
+        migrations.AddIndex(
+            model_name="recipe",
+            index=models.Index(
+                fields=["-popularity", "-id"], name="recipe_popularity_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="recipe",
+            index=models.Index(
+                fields=["-trending_score", "-id"], name="recipe_trending_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,85 @@
+# Generated by Django 4.2.1 on 2026-10-18 19:47
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicates(apps, schema_editor):
+    """Оставляет у каждой пары (название, единица) ингредиент с меньшим id.
+
+    Ингредиенты рецептов переносятся на оставшийся ингредиент
+    (количества складываются), затронутые позиции списков покупок
+    пересчитываются по корзинам.
+    """
+    Ingredient = apps.get_model("recipes", "Ingredient")
+    RecipeIngredient = apps.get_model("recipes", "RecipeIngredient")
+    ShoppingListItem = apps.get_model("recipes", "ShoppingListItem")
+    Cart = apps.get_model("recipes", "Cart")
+    groups = (
+        Ingredient.objects.values("name", "measurement_unit")
+        .annotate(keep=Min("id"), count=Count("id"))
+        .filter(count__gt=1)
+    )
+    replacements = {}
+    for group in groups:
+        for pk in (
+            Ingredient.objects.filter(
+                name=group["name"], measurement_unit=group["measurement_unit"]
+            )
+            .exclude(pk=group["keep"])
+            .values_list("pk", flat=True)
+        ):
+            replacements[pk] = group["keep"]
+    if not replacements:
+        return
+    for row in RecipeIngredient.objects.filter(ingredient_id__in=replacements):
+        target = replacements[row.ingredient_id]
+        kept = RecipeIngredient.objects.filter(
+            recipe_id=row.recipe_id, ingredient_id=target
+        ).first()
+        if kept is None:
+            row.ingredient_id = target
+            row.save(update_fields=["ingredient"])
+        else:
+            kept.amount += row.amount
+            kept.save(update_fields=["amount"])
+            row.delete()
+    kept_ids = set(replacements.values())
+    ShoppingListItem.objects.filter(
+        ingredient_id__in=kept_ids | set(replacements)
+    ).delete()
+    ShoppingListItem.objects.bulk_create(
+        ShoppingListItem(
+            user_id=row["user_id"],
+            ingredient_id=row["recipe__recipe_ingredients__ingredient_id"],
+            total_amount=row["total_amount"],
+            recipes_count=row["recipes_count"],
+        )
+        for row in Cart.objects.filter(
+            recipe__recipe_ingredients__ingredient_id__in=kept_ids
+        )
+        .values("user_id", "recipe__recipe_ingredients__ingredient_id")
+        .annotate(
+            total_amount=Sum("recipe__recipe_ingredients__amount"),
+            recipes_count=Count("recipe_id"),
+        )
+        .order_by()
+    )
+    Ingredient.objects.filter(pk__in=replacements).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0012_hot_path_indexes"),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="ingredient",
+            constraint=models.UniqueConstraint(
+                fields=("name", "measurement_unit"), name="unique_ingredient"
+            ),
+        ),
+    ]
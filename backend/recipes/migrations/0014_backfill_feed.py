@@ -0,0 +1,54 @@
+# Generated by Django 4.2.1 on 2026-10-18 23:05
+
+from django.conf import settings
+from django.db import migrations
+
+BATCH_SIZE = 1000
+
+
+def backfill_feeds(apps, schema_editor):
+    Follow = apps.get_model("users", "Follow")
+    Recipe = apps.get_model("recipes", "Recipe")
+    FeedEntry = apps.get_model("recipes", "FeedEntry")
+    author_ids = (
+        Follow.objects.order_by("author_id")
+        .values_list("author_id", flat=True)
+        .distinct()
+    )
+    for author_id in author_ids.iterator():
+        recipes = list(
+            Recipe.objects.filter(author_id=author_id)
+            .order_by("-pub_date", "-id")
+            .values_list("id", "pub_date")[: settings.FEED_BACKFILL_SIZE]
+        )
+        if not recipes:
+            continue
+        user_ids = Follow.objects.filter(author_id=author_id).values_list(
+            "user_id", flat=True
+        )
+        FeedEntry.objects.bulk_create(
+            (
+                FeedEntry(
+                    user_id=user_id,
+                    recipe_id=recipe_id,
+                    author_id=author_id,
+                    pub_date=pub_date,
+                )
+                for user_id in user_ids.iterator()
+                for recipe_id, pub_date in recipes
+            ),
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0004_hot_path_indexes"),
+        ("recipes", "0013_unique_ingredient"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_feeds, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.1 on 2026-10-18 20:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0014_backfill_feed"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="recipetombstone",
+            name="recipe_id",
+            field=models.BigIntegerField(verbose_name="ID рецепта"),
+        ),
+    ]
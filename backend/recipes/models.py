@@ -1,15 +1,71 @@
+from datetime import timedelta
+from itertools import islice
+
 from django.conf import settings
 from django.core.validators import MinValueValidator
-from django.db import models
-from django.db.models import UniqueConstraint
+from django.db import connections, models, router, transaction
+from django.db.models import (Count, Exists, F, OuterRef, Prefetch, Q, Sum,
+                              UniqueConstraint, Window)
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from users.models import CounterFieldsMixin, Follow, User, UserLinkManager
+
+
+class RecipeQuerySet(models.QuerySet):
+    """QuerySet рецептов с предзагрузкой связанных объектов."""
+
+    @staticmethod
+    def related_lookups():
+        """Связанные объекты, нужные для вывода рецепта."""
+        return (
+            'tags',
+            Prefetch(
+                'recipe_ingredients',
+                queryset=RecipeIngredient.objects.select_related('ingredient')
+            ),
+        )
+
+    def with_related(self):
+        """Подгружает теги и ингредиенты фиксированным числом запросов."""
+        return self.prefetch_related(*self.related_lookups())
 
-from users.models import User
+    def limited_per_author(self, limit):
+        """Оставляет не более limit последних рецептов каждого автора."""
+        if limit is None:
+            return self
+        return self.annotate(
+            author_row_number=Window(
+                RowNumber(),
+                partition_by=F('author'),
+                order_by=(F('pub_date').desc(), F('id').desc()),
+            )
+        ).filter(author_row_number__lte=limit)
+
+    def with_user_flags(self, user):
+        """Аннотирует рецепты флагами избранного, корзины и подписки."""
+        if user.is_anonymous:
+            return self.select_related('author')
+        return self.annotate(
+            is_favorited=Exists(
+                Favorite.objects.filter(user=user, recipe=OuterRef('pk'))
+            ),
+            is_in_shopping_cart=Exists(
+                Cart.objects.filter(user=user, recipe=OuterRef('pk'))
+            ),
+        ).prefetch_related(
+            Prefetch('author', queryset=User.objects.annotate(
+                is_subscribed=Exists(
+                    Follow.objects.filter(user=user, author=OuterRef('pk'))
+                )
+            ))
+        )
 
 
-class Recipe(models.Model):
+class Recipe(CounterFieldsMixin, models.Model):
     """Модель рецептов"""
     author = models.ForeignKey(
-        User, on_delete=models.CASCADE,
+        User, on_delete=models.CASCADE, db_index=False,
         related_name='recipes', verbose_name='Автор рецепта'
     )
     name = models.CharField(
@@ -20,10 +76,17 @@ class Recipe(models.Model):
         upload_to='recipes/images', blank=True,
         null=True, verbose_name='Фотография'
     )
+    image_variants = models.JSONField(
+        default=dict, blank=True, verbose_name='Варианты фотографии'
+    )
     pub_date = models.DateTimeField(
         auto_now_add=True, db_index=True,
         verbose_name='Дата публикации рецепта'
     )
+    updated_at = models.DateTimeField(
+        auto_now=True, db_index=True,
+        verbose_name='Дата изменения рецепта'
+    )
     cooking_time = models.IntegerField(
         validators=[MinValueValidator(
             1, message='Время приготовления должно быть больше 0 минут.'
@@ -35,16 +98,104 @@ class Recipe(models.Model):
     tags = models.ManyToManyField(
         'Tag', related_name='recipes', verbose_name='Тег'
     )
+    favorites_count = models.PositiveIntegerField(
+        default=0, db_index=True,
+        verbose_name='Количество добавлений в избранное'
+    )
+
+    popularity = models.PositiveIntegerField(
+        default=0, verbose_name='Популярность'
+    )
+    trending_score = models.FloatField(
+        default=0, verbose_name='Оценка для трендов'
+    )
+
+    counter_fields = ('favorites_count', 'popularity', 'trending_score')
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         ordering = ['-pub_date']
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='recipe_author_pub_date_idx'
+            ),
+            models.Index(
+                fields=['id'], condition=Q(image_variants={}) & ~Q(image=''),
+                name='recipe_pending_image_idx'
+            ),
+            models.Index(
+                fields=['-popularity', '-id'], name='recipe_popularity_idx'
+            ),
+            models.Index(
+                fields=['-trending_score', '-id'], name='recipe_trending_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.name
 
 
+class RecipeTombstoneManager(models.Manager):
+
+    def horizon(self):
+        """Самый ранний момент, удаления после которого известны."""
+        return timezone.now() - timedelta(
+            days=settings.RECIPE_TOMBSTONE_RETENTION_DAYS
+        )
+
+    def prune(self):
+        """Удаляет отметки старше срока хранения."""
+        return self.filter(deleted_at__lt=self.horizon()).delete()
+
+
+class RecipeTombstone(models.Model):
+    """Отметка об удалении рецепта для ленты изменений."""
+    recipe_id = models.BigIntegerField(verbose_name='ID рецепта')
+    deleted_at = models.DateTimeField(
+        auto_now_add=True, db_index=True,
+        verbose_name='Дата удаления рецепта'
+    )
+
+    objects = RecipeTombstoneManager()
+
+    class Meta:
+        ordering = ['deleted_at']
+        verbose_name = 'Удалённый рецепт'
+        verbose_name_plural = 'Удалённые рецепты'
+
+    def __str__(self):
+        return f'{self.recipe_id} ({self.deleted_at})'
+
+
+class IngredientManager(models.Manager):
+
+    def insert_missing(self, rows):
+        """Вставляет пары (название, единица измерения) одним запросом.
+
+        Уже существующие пары пропускаются через ON CONFLICT DO NOTHING.
+        Возвращает число вставленных строк.
+        """
+        if not rows:
+            return 0
+        connection = connections[router.db_for_write(self.model)]
+        meta = self.model._meta
+        quote_name = connection.ops.quote_name
+        values = ', '.join(['(%s, %s)'] * len(rows))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {quote_name(meta.db_table)} '
+                f'({quote_name(meta.get_field("name").column)}, '
+                f'{quote_name(meta.get_field("measurement_unit").column)}) '
+                f'VALUES {values} ON CONFLICT DO NOTHING',
+                [value for row in rows for value in row]
+            )
+            return cursor.rowcount
+
+
 class Ingredient(models.Model):
     """Модель ингредиентов"""
     name = models.CharField(
@@ -56,9 +207,23 @@ class Ingredient(models.Model):
         verbose_name='Единица измерения'
     )
 
+    objects = IngredientManager()
+
     class Meta:
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='unique_ingredient'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['name'], opclasses=['varchar_pattern_ops'],
+                name='ingredient_name_prefix_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -114,15 +279,23 @@ class Tag(models.Model):
         return self.name
 
 
+class FavoriteManager(UserLinkManager):
+    counter_field = 'favorites_count'
+
+
 class Favorite(models.Model):
     """Модель рецептов добавленных в избранное"""
     user = models.ForeignKey(
-        User, on_delete=models.CASCADE, related_name='favorites'
+        User, on_delete=models.CASCADE, db_index=False,
+        related_name='favorites'
     )
     recipe = models.ForeignKey(
-        Recipe, on_delete=models.CASCADE, related_name='in_favorites'
+        Recipe, on_delete=models.CASCADE, db_index=False,
+        related_name='in_favorites'
     )
 
+    objects = FavoriteManager()
+
     class Meta:
         verbose_name = 'Избранный рецепт'
         verbose_name_plural = 'Избранные рецепты'
@@ -131,17 +304,26 @@ class Favorite(models.Model):
                 fields=['user', 'recipe'], name='unique_recipe_in_favorites'
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['recipe', 'user'], name='favorite_recipe_user_idx'
+            ),
+        ]
 
 
 class Cart(models.Model):
     """Модель корзины для покупок"""
     user = models.ForeignKey(
-        User, on_delete=models.CASCADE, related_name='cart_recipe'
+        User, on_delete=models.CASCADE, db_index=False,
+        related_name='cart_recipe'
     )
     recipe = models.ForeignKey(
-        Recipe, on_delete=models.CASCADE, related_name='cart_recipe'
+        Recipe, on_delete=models.CASCADE, db_index=False,
+        related_name='cart_recipe'
     )
 
+    objects = UserLinkManager()
+
     class Meta:
         verbose_name = 'Рецепт в корзине'
         verbose_name_plural = 'Рецепты в корзине'
@@ -150,6 +332,222 @@ class Cart(models.Model):
                 fields=['user', 'recipe'], name='unique_recipe_in_cart'
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['recipe', 'user'], name='cart_recipe_user_idx'
+            ),
+        ]
 
     def __str__(self):
         return f'{self.user} - {self.recipe}'
+
+
+class ShoppingListItemManager(models.Manager):
+    """Инкрементальное обновление агрегированного списка покупок."""
+
+    def recipe_amounts(self, recipe_ids):
+        """Количество и число рецептов по каждому ингредиенту."""
+        amounts = {}
+        rows = RecipeIngredient.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list('ingredient_id', 'amount')
+        for ingredient_id, amount in rows:
+            total, count = amounts.get(ingredient_id, (0, 0))
+            amounts[ingredient_id] = (total + amount, count + 1)
+        return amounts
+
+    def add_recipes(self, user, recipe_ids):
+        """Учитывает рецепты, добавленные в корзину."""
+        amounts = self.recipe_amounts(recipe_ids)
+        self.apply_changes({
+            (user.id, ingredient_id): change
+            for ingredient_id, change in amounts.items()
+        })
+
+    def remove_recipes(self, user, recipe_ids):
+        """Учитывает рецепты, удалённые из корзины."""
+        amounts = self.recipe_amounts(recipe_ids)
+        self.apply_changes({
+            (user.id, ingredient_id): (-total, -count)
+            for ingredient_id, (total, count) in amounts.items()
+        })
+
+    def remove_recipe_everywhere(self, recipe):
+        """Убирает рецепт из списков всех пользователей перед удалением."""
+        user_ids = Cart.objects.filter(
+            recipe=recipe
+        ).values_list('user_id', flat=True)
+        amounts = self.recipe_amounts([recipe.id])
+        self.apply_changes({
+            (user_id, ingredient_id): (-total, -count)
+            for user_id in user_ids
+            for ingredient_id, (total, count) in amounts.items()
+        })
+
+    def change_recipe_ingredients(self, recipe, old_amounts, new_amounts):
+        """Переносит изменение состава рецепта в списки покупок.
+
+        old_amounts и new_amounts отображают id ингредиента
+        в его количество до и после изменения.
+        """
+        changes = {}
+        for ingredient_id in old_amounts.keys() | new_amounts.keys():
+            old_amount = old_amounts.get(ingredient_id)
+            new_amount = new_amounts.get(ingredient_id)
+            if old_amount == new_amount:
+                continue
+            count = (new_amount is not None) - (old_amount is not None)
+            changes[ingredient_id] = (
+                (new_amount or 0) - (old_amount or 0), count
+            )
+        if not changes:
+            return
+        user_ids = Cart.objects.filter(
+            recipe=recipe
+        ).values_list('user_id', flat=True)
+        self.apply_changes({
+            (user_id, ingredient_id): change
+            for user_id in user_ids
+            for ingredient_id, change in changes.items()
+        })
+
+    def apply_changes(self, changes):
+        """Применяет изменения вида (user_id, ingredient_id) -> (сумма, число).
+
+        Строки пользователей блокируются, чтобы параллельные изменения
+        корзины одного пользователя применялись последовательно.
+        """
+        if not changes:
+            return
+        user_ids = {user_id for user_id, _ in changes}
+        ingredient_ids = {ingredient_id for _, ingredient_id in changes}
+        with transaction.atomic():
+            list(User.objects.select_for_update().filter(id__in=user_ids))
+            existing = {
+                (item.user_id, item.ingredient_id): item
+                for item in self.filter(
+                    user_id__in=user_ids, ingredient_id__in=ingredient_ids
+                )
+            }
+            to_create, to_update, to_delete = [], [], []
+            for (user_id, ingredient_id), (total, count) in changes.items():
+                item = existing.get((user_id, ingredient_id))
+                if item is None:
+                    if count > 0:
+                        to_create.append(self.model(
+                            user_id=user_id, ingredient_id=ingredient_id,
+                            total_amount=total, recipes_count=count
+                        ))
+                    continue
+                item.total_amount += total
+                item.recipes_count += count
+                if item.recipes_count > 0:
+                    to_update.append(item)
+                else:
+                    to_delete.append(item.id)
+            self.bulk_create(to_create)
+            self.bulk_update(to_update, ('total_amount', 'recipes_count'))
+            self.filter(id__in=to_delete).delete()
+
+    def calculate(self, users=None):
+        """Полный пересчёт списков покупок по корзинам."""
+        carts = Cart.objects.all()
+        if users is not None:
+            carts = carts.filter(user__in=users)
+        return carts.filter(
+            recipe__recipe_ingredients__isnull=False
+        ).values(
+            'user_id', 'recipe__recipe_ingredients__ingredient_id'
+        ).annotate(
+            total_amount=Sum('recipe__recipe_ingredients__amount'),
+            recipes_count=Count('recipe_id'),
+        ).order_by()
+
+    def rebuild(self, users=None, batch_size=1000):
+        """Пересобирает списки покупок с нуля."""
+        items = self.all()
+        if users is not None:
+            items = items.filter(user__in=users)
+        with transaction.atomic():
+            items.delete()
+            rows = self.calculate(users).iterator(chunk_size=batch_size)
+            while True:
+                batch = [
+                    self.model(
+                        user_id=row['user_id'],
+                        ingredient_id=row[
+                            'recipe__recipe_ingredients__ingredient_id'
+                        ],
+                        total_amount=row['total_amount'],
+                        recipes_count=row['recipes_count'],
+                    )
+                    for row in islice(rows, batch_size)
+                ]
+                if not batch:
+                    break
+                self.bulk_create(batch)
+
+
+class ShoppingListItem(models.Model):
+    """Суммарное количество ингредиента в корзине пользователя"""
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='shopping_list'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient, on_delete=models.CASCADE, related_name='shopping_list'
+    )
+    total_amount = models.FloatField(verbose_name='Общее количество')
+    recipes_count = models.PositiveIntegerField(
+        verbose_name='Число рецептов с ингредиентом'
+    )
+
+    objects = ShoppingListItemManager()
+
+    class Meta:
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Списки покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_ingredient_in_shopping_list'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.user}: {self.ingredient} - {self.total_amount}'
+
+
+class FeedEntry(models.Model):
+    """Рецепт автора в ленте подписчика.
+
+    Дата публикации копируется из рецепта, чтобы лента читалась
+    одним проходом по индексу (user, -pub_date, -recipe).
+    """
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='feed_entries'
+    )
+    recipe = models.ForeignKey(
+        Recipe, on_delete=models.CASCADE, related_name='feed_entries'
+    )
+    author = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='+'
+    )
+    pub_date = models.DateTimeField(verbose_name='Дата публикации рецепта')
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Лента подписок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'], name='unique_recipe_in_feed'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-recipe'],
+                name='feed_user_pub_date_idx'
+            ),
+            models.Index(
+                fields=['user', 'author'], name='feed_user_author_idx'
+            ),
+        ]
@@ -0,0 +1,139 @@
+import re
+import threading
+from bisect import bisect_left, bisect_right
+from difflib import SequenceMatcher
+
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector,
+                                            TrigramWordSimilarity)
+from django.db import connection
+from django.db.models import Case, FloatField, Q, Value, When
+
+from recipes.caches import get_version
+from recipes.models import Ingredient
+
+INGREDIENTS_VERSION = 'ingredients'
+PREFIX_END = '\U0010ffff'
+SEARCH_CONFIG = 'russian'
+NAME_SIMILARITY = 0.6
+WORD_PATTERN = re.compile(r'\w+')
+# Сортировка результатов поиска, с id для курсора.
+SEARCH_ORDERING = ('-rank', '-pub_date', '-id')
+
+
+class IngredientIndex:
+    """Индекс ингредиентов в памяти процесса для автодополнения.
+
+    Ингредиенты хранятся отсортированными по названию в нижнем регистре,
+    поиск по префиксу выполняется бинарным поиском. Индекс строится
+    при первом обращении и перестраивается после изменения версии
+    таблицы ингредиентов.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._keys = []
+        self._entries = []
+
+    def build(self):
+        """Загружает ингредиенты из базы."""
+        rows = Ingredient.objects.values('id', 'name', 'measurement_unit')
+        entries = sorted(
+            rows, key=lambda row: (row['name'].lower(), row['id'])
+        )
+        return [entry['name'].lower() for entry in entries], entries
+
+    def get_entries(self):
+        version = get_version(INGREDIENTS_VERSION)
+        if self._version != version:
+            with self._lock:
+                if self._version != version:
+                    self._keys, self._entries = self.build()
+                    self._version = version
+        return self._keys, self._entries
+
+    def search(self, query='', limit=None):
+        """Ингредиенты, начинающиеся с query, затем содержащие query."""
+        keys, entries = self.get_entries()
+        query = query.strip().lower()
+        if not query:
+            return entries[:limit]
+        start = bisect_left(keys, query)
+        end = bisect_right(keys, query + PREFIX_END, lo=start)
+        results = entries[start:end][:limit]
+        if limit is not None and len(results) >= limit:
+            return results
+        for position, key in enumerate(keys):
+            if start <= position < end or query not in key:
+                continue
+            results.append(entries[position])
+            if limit is not None and len(results) >= limit:
+                break
+        return results
+
+
+ingredient_index = IngredientIndex()
+
+
+def python_rank(query, name, text):
+    """Приближённая релевантность рецепта для баз без pg_trgm.
+
+    Название оценивается по сходству с ближайшим словом, описание -
+    по доле найденных слов запроса.
+    """
+    name = name.lower()
+    text_words = set(WORD_PATTERN.findall(text.lower()))
+    query_words = WORD_PATTERN.findall(query) or [query]
+    if query in name:
+        name_score = 1.0
+    else:
+        name_score = max(
+            (SequenceMatcher(None, query, word).ratio()
+             for word in WORD_PATTERN.findall(name)),
+            default=0.0
+        )
+    text_score = sum(
+        word in text_words for word in query_words
+    ) / len(query_words)
+    return name_score if name_score >= NAME_SIMILARITY else 0.0, text_score
+
+
+def search_recipes(queryset, query):
+    """Фильтрует рецепты по названию и описанию с сортировкой по релевантности.
+
+    В PostgreSQL используются GIN-индексы по триграммам названия
+    и по tsvector описания, в остальных базах - ранжирование на Python.
+    """
+    query = query.strip().lower()
+    if not query:
+        return queryset
+    if connection.vendor == 'postgresql':
+        vector = SearchVector('text', config=SEARCH_CONFIG)
+        search_query = SearchQuery(
+            query, config=SEARCH_CONFIG, search_type='websearch'
+        )
+        return queryset.annotate(
+            text_vector=vector,
+            rank=(
+                TrigramWordSimilarity(query, 'name')
+                + SearchRank(vector, search_query)
+            ),
+        ).filter(
+            Q(name__trigram_word_similar=query)
+            | Q(text_vector=search_query)
+        ).order_by(*SEARCH_ORDERING)
+    ranks = {}
+    candidates = queryset.values_list('id', 'name', 'text').order_by()
+    for recipe_id, name, text in candidates.iterator():
+        rank = sum(python_rank(query, name, text))
+        if rank > 0:
+            ranks[recipe_id] = rank
+    return queryset.filter(id__in=ranks).annotate(
+        rank=Case(
+            *(When(id=recipe_id, then=Value(rank))
+              for recipe_id, rank in ranks.items()),
+            default=Value(0.0),
+            output_field=FloatField(),
+        )
+    ).order_by(*SEARCH_ORDERING)
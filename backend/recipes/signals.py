@@ -0,0 +1,65 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from recipes.caches import TAGS_VERSION, bump_version
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeTombstone,
+                            ShoppingListItem, Tag)
+from recipes.search import INGREDIENTS_VERSION
+from users.models import User, update_counter
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredient_index(sender, **kwargs):
+    """Сбрасывает индекс автодополнения после изменения ингредиентов.
+
+    Версия меняется после фиксации транзакции, иначе другой поток
+    перестроит индекс по незафиксированным данным под новой версией.
+    """
+    transaction.on_commit(lambda: bump_version(INGREDIENTS_VERSION))
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_tag_cache(sender, **kwargs):
+    """Сбрасывает кэш slug тегов после фиксации изменения тегов."""
+    transaction.on_commit(lambda: bump_version(TAGS_VERSION))
+
+
+@receiver(pre_delete, sender=Recipe)
+def remove_from_shopping_lists(sender, instance, **kwargs):
+    """Убирает рецепт из списков покупок при любом удалении.
+
+    Вызывается и для удаления из админки, и для каскада от автора,
+    пока строки корзины ещё не удалены.
+    """
+    ShoppingListItem.objects.remove_recipe_everywhere(instance)
+
+
+@receiver(post_delete, sender=Recipe)
+def create_recipe_tombstone(sender, instance, **kwargs):
+    """Сохраняет отметку об удалении рецепта для ленты изменений.
+
+    Заодно удаляются отметки старше срока хранения.
+    """
+    RecipeTombstone.objects.prune()
+    RecipeTombstone.objects.create(recipe_id=instance.id)
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def update_recipes_count(sender, instance, created=False, **kwargs):
+    """Меняет счётчик рецептов автора."""
+    if created or kwargs['signal'] is post_delete:
+        update_counter(
+            User.objects.filter(pk=instance.author_id),
+            'recipes_count', 1 if created else -1
+        )
+
+
+@receiver((post_save, post_delete), sender=Favorite)
+def update_favorites_count(sender, instance, created=False, **kwargs):
+    """Меняет счётчик добавлений рецепта в избранное."""
+    if created or kwargs['signal'] is post_delete:
+        update_counter(
+            Recipe.objects.filter(pk=instance.recipe_id),
+            'favorites_count', 1 if created else -1
+        )
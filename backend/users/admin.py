@@ -5,7 +5,10 @@ from .models import Follow, User
 
 
 class UserAdmin(admin.ModelAdmin):
-    list_display = ('id', 'username', 'email', 'first_name', 'last_name',)
+    list_display = (
+        'id', 'username', 'email', 'first_name', 'last_name',
+        'recipes_count', 'followers_count',
+    )
     list_filter = ('email', 'username',)
 
 
@@ -1,9 +1,129 @@
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import connections, models, router, transaction
+from django.db.models import F
 
 
-class User(AbstractUser):
+def update_counter(queryset, field, delta):
+    """Меняет счётчик одним UPDATE с F(), не опуская его ниже нуля."""
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    return queryset.update(**{field: F(field) + delta})
+
+
+class CounterFieldsMixin:
+    """Сохранение модели без перезаписи счётчиков.
+
+    Счётчики и оценки меняются отдельными UPDATE, поэтому save
+    существующего объекта не записывает их устаревшие значения.
+    Отложенные поля тоже не записываются, как и в обычном save.
+    """
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if (
+            not self._state.adding
+            and not args
+            and kwargs.get('update_fields') is None
+        ):
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields
+                and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
+
+
+class UserLinkManager(models.Manager):
+    """Связи пользователя с объектами, изменяемые одним запросом.
+
+    Вставка идёт через ON CONFLICT DO NOTHING, вставка и удаление
+    возвращают изменённые строки через RETURNING (PostgreSQL,
+    SQLite 3.35+). Повторные и параллельные запросы не вызывают
+    IntegrityError, а вызывающий код точно знает, что изменилось.
+    Объект связи - внешний ключ модели, отличный от user.
+    Если задан counter_field, счётчик объекта связи меняется
+    в той же транзакции.
+    """
+    counter_field = None
+
+    def execute(self, sql, params):
+        connection = connections[router.db_for_write(self.model)]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    def target_field(self):
+        return next(
+            field for field in self.model._meta.concrete_fields
+            if field.many_to_one and field.name != 'user'
+        )
+
+    def columns(self):
+        meta = self.model._meta
+        quote_name = connections[
+            router.db_for_write(self.model)
+        ].ops.quote_name
+        return (
+            quote_name(meta.db_table),
+            quote_name(meta.get_field('user').column),
+            quote_name(self.target_field().column),
+            quote_name(meta.pk.column),
+        )
+
+    def update_counter(self, target_ids, delta):
+        if self.counter_field is None or not target_ids:
+            return
+        update_counter(
+            self.target_field().related_model.objects.filter(
+                pk__in=target_ids
+            ),
+            self.counter_field, delta
+        )
+
+    def link(self, user, target_ids):
+        """Создаёт недостающие связи.
+
+        Возвращает словарь id объекта - id созданной связи.
+        """
+        if not target_ids:
+            return {}
+        table, user_column, target_column, pk_column = self.columns()
+        values = ', '.join(['(%s, %s)'] * len(target_ids))
+        with transaction.atomic(using=router.db_for_write(self.model)):
+            created = dict(self.execute(
+                f'INSERT INTO {table} ({user_column}, {target_column}) '
+                f'VALUES {values} ON CONFLICT DO NOTHING '
+                f'RETURNING {target_column}, {pk_column}',
+                [value for pk in target_ids for value in (user.id, pk)]
+            ))
+            self.update_counter(list(created), 1)
+        return created
+
+    def unlink(self, user, target_ids):
+        """Удаляет связи, возвращает id объектов удалённых связей."""
+        if not target_ids:
+            return []
+        table, user_column, target_column, _ = self.columns()
+        placeholders = ', '.join(['%s'] * len(target_ids))
+        with transaction.atomic(using=router.db_for_write(self.model)):
+            deleted = [row[0] for row in self.execute(
+                f'DELETE FROM {table} WHERE {user_column} = %s '
+                f'AND {target_column} IN ({placeholders}) '
+                f'RETURNING {target_column}',
+                [user.id, *target_ids]
+            )]
+            self.update_counter(deleted, -1)
+        return deleted
+
+
+class FollowManager(UserLinkManager):
+    counter_field = 'followers_count'
+
+
+class User(CounterFieldsMixin, AbstractUser):
     """Модель пользователя"""
     first_name = models.CharField(
         max_length=settings.USER_MAX_LENGTH, verbose_name='Имя'
@@ -22,6 +142,14 @@ class User(AbstractUser):
     password = models.CharField(
         max_length=settings.USER_MAX_LENGTH, verbose_name='Пароль'
     )
+    recipes_count = models.PositiveIntegerField(
+        default=0, verbose_name='Количество рецептов'
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0, verbose_name='Количество подписчиков'
+    )
+
+    counter_fields = ('recipes_count', 'followers_count')
 
     class Meta:
         ordering = ('id',)
@@ -34,12 +162,16 @@ class User(AbstractUser):
 
 class Follow(models.Model):
     author = models.ForeignKey(
-        User, on_delete=models.CASCADE, related_name='author'
+        User, on_delete=models.CASCADE, db_index=False,
+        related_name='author'
     )
     user = models.ForeignKey(
-        User, on_delete=models.CASCADE, related_name='follower'
+        User, on_delete=models.CASCADE, db_index=False,
+        related_name='follower'
     )
 
+    objects = FollowManager()
+
     class Meta:
         ordering = ('-author_id',)
         verbose_name = 'Подписки'
@@ -50,6 +182,11 @@ class Follow(models.Model):
                 name='unique_following'
             ),
         ]
+        indexes = [
+            models.Index(
+                fields=['user', '-author'], name='follow_user_author_idx'
+            ),
+        ]
 
     def save(self, *args, **kwargs):
         if self.user == self.author:
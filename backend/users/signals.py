@@ -0,0 +1,14 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from users.models import Follow, User, update_counter
+
+
+@receiver((post_save, post_delete), sender=Follow)
+def update_followers_count(sender, instance, created=False, **kwargs):
+    """Меняет счётчик подписчиков автора."""
+    if created or kwargs['signal'] is post_delete:
+        update_counter(
+            User.objects.filter(pk=instance.author_id),
+            'followers_count', 1 if created else -1
+        )